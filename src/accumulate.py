@@ -0,0 +1,75 @@
+"""streaming statistics of a sequence of (masked) 2d fields, so that climatologies can be made one field at a time without holding the whole stack in memory"""
+import numpy as np
+
+class StreamingStats(object):
+    """accumulates the mean, variance, min, max and number of valid values at each gridpoint of a sequence of fields, using welford's update.
+    masked values are left out, so each gridpoint only counts the fields where it is valid. memory use does not depend on the number of fields."""
+
+    def __init__(self, shape=None):
+        self.shape = None
+        if shape is not None:
+            self._start(shape)
+
+    def _start(self, shape):
+        self.shape = tuple(shape)
+        self.count = np.zeros(self.shape, dtype='int64')
+        self._mean = np.zeros(self.shape, dtype='float64')
+        self._m2 = np.zeros(self.shape, dtype='float64')
+        self._min = np.full(self.shape, np.inf)
+        self._max = np.full(self.shape, -np.inf)
+
+    def add(self, field):
+        """adds a single 2d field"""
+        if self.shape is None:
+            self._start(np.shape(field))
+        valid = ~np.ma.getmaskarray(field)
+        x = np.ma.getdata(field).astype('float64')
+        self.count += valid
+        # the values under the mask may be anything, so they are kept out of the arithmetic
+        with np.errstate(invalid='ignore', over='ignore'):
+            delta = np.where(valid, x - self._mean, 0.0)
+            self._mean += delta/np.maximum(self.count, 1)
+            self._m2 += delta*np.where(valid, x - self._mean, 0.0)
+        self._min = np.where(valid, np.minimum(self._min, x), self._min)
+        self._max = np.where(valid, np.maximum(self._max, x), self._max)
+
+    def update(self, stack):
+        """adds every field of a stack (time*lat*lon), one at a time so that a memory mapped stack is never read in all at once"""
+        for i in xrange(len(stack)):
+            self.add(stack[i])
+        return self
+
+    def mean(self):
+        """returns the mean at each gridpoint, masked where there were no valid values"""
+        return np.ma.masked_where(self.count == 0, self._mean)
+
+    def variance(self, ddof=0):
+        """returns the variance at each gridpoint (with ddof delta degrees of freedom, as in np.var), masked where there were not enough valid values"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = self._m2/(self.count - ddof)
+        return np.ma.masked_where(self.count <= ddof, var)
+
+    def std(self, ddof=0):
+        """returns the standard deviation at each gridpoint"""
+        return np.ma.sqrt(self.variance(ddof))
+
+    def min(self):
+        return np.ma.masked_where(self.count == 0, self._min)
+
+    def max(self):
+        return np.ma.masked_where(self.count == 0, self._max)
+
+    def to_array(self):
+        """packs the state into a single (5*lat*lon) array of count, mean, sum of squared differences, min and max, e.g. to store it in the cube cache"""
+        return np.array([self.count, self._mean, self._m2, self._min, self._max], dtype='float64')
+
+    @classmethod
+    def from_array(cls, array):
+        """unpacks a state made by to_array"""
+        stats = cls(np.shape(array)[1:])
+        stats.count = np.asarray(array[0]).astype('int64')
+        stats._mean = np.array(array[1])
+        stats._m2 = np.array(array[2])
+        stats._min = np.array(array[3])
+        stats._max = np.array(array[4])
+        return stats
@@ -0,0 +1,118 @@
+"""persistent on-disk cache for arrays extracted from model and NSIDC files. each entry is stored as a .npy file so it can be memory mapped back in."""
+import os
+import hashlib
+import json
+import numpy as np
+
+# cache lives on the local disk, not on the network share
+CACHE_DIR = os.environ.get("SEAICE_CACHE", os.path.join(os.path.expanduser("~"), ".seaice_cache"))
+MAX_BYTES = 20*1024**3
+
+def file_signature(paths):
+    """returns a list of (filename, size, mtime) for each file in paths. any change to a source file changes its signature"""
+    signature = []
+    for filepath in paths:
+        info = os.stat(filepath)
+        signature.append((os.path.basename(filepath), info.st_size, int(info.st_mtime)))
+    return signature
+
+class CubeCache(object):
+    """content addressed store of (masked) arrays. entries are keyed by a description of what was extracted
+    (e.g. model, variable, month and region) together with the signature of the files it was extracted from, so
+    that changing a source file makes its old entries unreachable. the least recently used entries are deleted once the
+    cache grows past max_bytes."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, parts, sources, signature=None):
+        """hashes the description parts and the signature of the source files into a key. the signature can be given instead of the
+        sources if it is already known (e.g. from a catalogue), which saves stat-ing every file"""
+        if signature is None:
+            signature = file_signature(sources)
+        return hashlib.sha1(repr((tuple(parts), signature))).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.root, key)
+        return base + ".data.npy", base + ".mask.npy", base + ".json"
+
+    def load(self, key):
+        """returns (array, attrs) for key, with the array memory mapped from disk, or None if there is no such entry"""
+        datafile, maskfile, attrfile = self._paths(key)
+        if not os.path.exists(attrfile):
+            return None
+        # another process may evict the entry at any point, in which case it is treated as missing
+        try:
+            # touching the entry so that it counts as recently used
+            os.utime(datafile, None)
+            with open(attrfile) as File:
+                attrs = json.load(File)
+            data = np.load(datafile, mmap_mode='r')
+            if attrs.pop("masked", os.path.exists(maskfile)):
+                data = np.ma.array(data, mask=np.load(maskfile, mmap_mode='r'))
+        except (IOError, OSError, ValueError):
+            return None
+        return data, attrs
+
+    def save(self, key, array, attrs=None):
+        """stores array (and a dictionary of attributes such as units) under key, then evicts old entries if the cache is too big"""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        datafile, maskfile, attrfile = self._paths(key)
+        masked = np.ma.isMaskedArray(array)
+        # every file is written under a temporary name first and then renamed over the old one, so no other process can map a half written
+        # file. the attribute file is renamed last, an entry only counts as present once it exists
+        tempfiles = []
+        for filepath, contents in [(datafile, np.ma.getdata(array)), (maskfile, np.ma.getmaskarray(array) if masked else None)]:
+            if contents is None:
+                continue
+            tempfile = "{}.{}.npy".format(filepath[:-len(".npy")], os.getpid())
+            np.save(tempfile, contents)
+            tempfiles.append((tempfile, filepath))
+        tempfile = "{}.{}".format(attrfile, os.getpid())
+        with open(tempfile, "w") as File:
+            json.dump(dict(attrs or {}, masked=masked), File)
+        tempfiles.append((tempfile, attrfile))
+        for tempfile, filepath in tempfiles:
+            os.rename(tempfile, filepath)
+        self.evict()
+
+    def cached(self, parts, sources, func):
+        """returns the array described by parts and extracted from the files in sources, calling func() to make it if it is not already stored"""
+        key = self.key(parts, sources)
+        entry = self.load(key)
+        if entry is not None:
+            return entry[0]
+        array = func()
+        self.save(key, array)
+        return array
+
+    def evict(self):
+        """deletes the least recently used entries until the cache is smaller than max_bytes"""
+        entries = {}
+        for filename in os.listdir(self.root):
+            # files still being written by save() have the pid in their names, and are left alone
+            if filename.count(".") != 2:
+                continue
+            key = filename.split(".")[0]
+            try:
+                info = os.stat(os.path.join(self.root, filename))
+            except OSError:
+                # renamed or evicted by another process since the listing
+                continue
+            size, used = entries.get(key, (0, 0))
+            if filename.endswith(".data.npy"):
+                used = info.st_mtime
+            entries[key] = (size + info.st_size, used)
+        total = sum(size for size, used in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            # the attribute file goes first so that the entry stops counting as present before its arrays are removed
+            for filepath in reversed(self._paths(key)):
+                try:
+                    os.remove(filepath)
+                except OSError:
+                    pass
+            total -= entries[key][0]
@@ -0,0 +1,88 @@
+"""persistent index of the monthly output files of each model, so that the directories on the network share only need listing when new files land"""
+import os
+import re
+import json
+import hashlib
+import cache
+
+# catalogues live on the local disk next to the cube cache
+CATALOGUE_DIR = os.path.join(cache.CACHE_DIR, "catalogue")
+# monthly CICE output is named e.g. cice_au866i_1m_19900101-19900201.nc, the year and month are those of the start date
+FILENAME = re.compile(r"_1m_(\d{4})(\d{2})\d{2}-\d{8}\.nc$")
+
+# catalogues which have already been refreshed in this process, by directory
+_catalogues = {}
+
+class Catalogue(object):
+    """the monthly files of one model directory as a list of (year, month, path, size, mtime) records, sorted by date. files whose
+    names do not look like monthly output are left out. the records are stored as json, and refresh() only lists the directory again
+    if its mtime has changed since. files are still stat-ed on every refresh, which is one stat per file per process."""
+
+    def __init__(self, icedir, catalogue_dir=CATALOGUE_DIR):
+        self.icedir = os.path.abspath(icedir)
+        self.catfile = os.path.join(catalogue_dir, hashlib.sha1(self.icedir).hexdigest() + ".json")
+        self.records = []
+        self.dir_mtime = None
+        if os.path.exists(self.catfile):
+            with open(self.catfile) as File:
+                stored = json.load(File)
+            self.records = [(year, month, str(path), size, mtime) for year, month, path, size, mtime in stored["records"]]
+            self.dir_mtime = stored["dir_mtime"]
+
+    def refresh(self, force=False):
+        """brings the records up to date with the directory, returning the number of records added or removed (a changed file is one of each). every catalogued file
+        is stat-ed again, so that files rewritten in place get new records (and so new cache keys)"""
+        dir_mtime = os.stat(self.icedir).st_mtime
+        if dir_mtime == self.dir_mtime and not force:
+            filepaths = [record[2] for record in self.records]
+        else:
+            filepaths = [os.path.join(self.icedir, filename) for filename in os.listdir(self.icedir) if FILENAME.search(filename)]
+        records = []
+        for filepath in filepaths:
+            match = FILENAME.search(os.path.basename(filepath))
+            try:
+                info = os.stat(filepath)
+            except OSError:
+                # removed since the directory was listed
+                continue
+            records.append((int(match.group(1)), int(match.group(2)), filepath, info.st_size, int(info.st_mtime)))
+        records.sort()
+        changed = len(set(records) ^ set(self.records))
+        if changed or dir_mtime != self.dir_mtime:
+            self.records = records
+            self.dir_mtime = dir_mtime
+            self.save()
+        return changed
+
+    def save(self):
+        catalogue_dir = os.path.dirname(self.catfile)
+        if not os.path.isdir(catalogue_dir):
+            os.makedirs(catalogue_dir)
+        with open(self.catfile, "w") as File:
+            json.dump({"icedir": self.icedir, "dir_mtime": self.dir_mtime, "records": self.records}, File)
+
+    def files(self, months=None, years=None):
+        """returns the records for the months in the list months (every month if None) and the years in the inclusive range
+        years = (first, last) (every year if None), sorted by date"""
+        records = self.records
+        if months is not None:
+            records = [record for record in records if record[1] in months]
+        if years is not None:
+            records = [record for record in records if years[0] <= record[0] <= years[1]]
+        return records
+
+    def paths(self, months=None, years=None):
+        """returns the paths of the files which files() would return"""
+        return [record[2] for record in self.files(months, years)]
+
+def signature(records):
+    """returns the same (filename, size, mtime) signature as cache.file_signature, from catalogue records instead of stat-ing each file"""
+    return [(os.path.basename(path), size, mtime) for year, month, path, size, mtime in records]
+
+def catalogue(icedir):
+    """returns the Catalogue of icedir, refreshing it the first time it is asked for in a process"""
+    icedir = os.path.abspath(icedir)
+    if icedir not in _catalogues:
+        _catalogues[icedir] = Catalogue(icedir)
+        _catalogues[icedir].refresh()
+    return _catalogues[icedir]
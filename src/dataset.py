@@ -0,0 +1,190 @@
+"""a model run as a lazy dataset. variables look like (time, y, x) arrays over every monthly file of the run, but nothing is read until they
+are sliced or reduced, and reductions stream through the files one field at a time so runs bigger than memory can still be analysed."""
+import itertools
+import numpy as np
+from netCDF4 import Dataset
+import grab
+import accumulate
+
+# number of fields chunks() hands out at a time by default, a year of monthly files
+CHUNK = 12
+
+class ModelRun(object):
+    """the monthly files of model modelname under path (anything grab takes as a path, or another ModelRun), south of boundinglat
+    (grab.BOUNDINGLAT by default) and in the inclusive range years = (first, last) if given. fields are returned in dtype (grab.DTYPE by default).
+    root is the grab.DataRoot the run is under. a run is not a path itself, as the grab functions would drop its years, rows and dtype,
+    so the functions below (and the plot and process functions which take a run) stand in for them. run[varname] is the LazyVariable of varname."""
+
+    def __init__(self, path, modelname, boundinglat=None, years=None, dtype=None):
+        if isinstance(path, ModelRun):
+            path = path.root
+        self.root = grab.data_root(path)
+        self.modelname = modelname
+        self.directory = self.root.icedir(modelname)
+        self.boundinglat = boundinglat
+        self.years = years
+        self.dtype = dtype
+        self.records = grab._catalogue(self.directory).files(years=years)
+        self.rows = grab._rows(self.directory, boundinglat)
+        model = grab._model_grid(self.directory)
+        self.lons = model.lons[self.rows]
+        self.lats = model.lats[self.rows]
+        self.tarea = model.tarea[self.rows]
+        self.landmask = model.landmask[self.rows]
+
+    def __getitem__(self, varname):
+        return self.variable(varname)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return "ModelRun({!r}, {!r}, {} files)".format(self.root.models, self.modelname, len(self.records))
+
+    def like(self, modelname):
+        """returns the run of another model (e.g. the control) under the same path, over the same years and rows and in the same dtype"""
+        return ModelRun(self, modelname, self.boundinglat, self.years, self.dtype)
+
+    def variable(self, varname, isice=True):
+        """returns the LazyVariable of varname. if isice is false, points with no ice are masked as they are by the grab loaders"""
+        return LazyVariable(self, varname, isice)
+
+    @property
+    def variables(self):
+        """the names of the variables in the files of the run"""
+        testdata = Dataset(self.records[0][2])
+        names = list(testdata.variables)
+        testdata.close()
+        return names
+
+class LazyVariable(object):
+    """varname in the files records (every file of run by default) as a (time, y, x) masked array which is only read when it is sliced or
+    reduced. indexing the time axis reads just the files asked for (reading ahead as grab does), reductions over time are made with
+    accumulate.StreamingStats so only one field is held at once, and months() picks out the files of some months without reading anything."""
+
+    def __init__(self, run, varname, isice=True, records=None):
+        self.run = run
+        self.varname = varname
+        self.isice = isice
+        if records is None:
+            records = run.records
+        self.records = records
+        self.shape = (len(records),) + run.lats.shape
+        self.ndim = 3
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return "LazyVariable({!r}, {!r}, shape={})".format(self.run.modelname, self.varname, self.shape)
+
+    @property
+    def years(self):
+        return np.array([record[0] for record in self.records], dtype=int)
+
+    @property
+    def month_numbers(self):
+        return np.array([record[1] for record in self.records], dtype=int)
+
+    @property
+    def units(self):
+        testdata = Dataset(self.records[0][2])
+        units = getattr(testdata.variables[self.varname], "units", None)
+        testdata.close()
+        return units
+
+    def months(self, months):
+        """returns this variable for only the files of the months in the list months"""
+        return LazyVariable(self.run, self.varname, self.isice, [record for record in self.records if record[1] in months])
+
+    def fields(self, indices=None):
+        """yields the (y, x) field of each file at indices along the time axis (every file by default) in order"""
+        if indices is None:
+            indices = range(len(self.records))
+        paths = [self.records[index][2] for index in indices]
+        for units, myvars in grab._prefetch(paths, [self.varname], self.run.rows, self.isice, self.run.dtype):
+            yield myvars[self.varname]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        indices = np.arange(len(self.records))[key[0]]
+        rest = key[1:]
+        if np.ndim(indices) == 0:
+            return next(self.fields([indices]))[rest]
+        fields = list(self.fields(indices))
+        if not fields:
+            return np.ma.zeros((0,) + self.shape[1:])[(slice(None),) + rest]
+        return np.ma.stack(fields)[(slice(None),) + rest]
+
+    def chunks(self, size=CHUNK):
+        """yields (indices, stack) for runs of size files at a time along the time axis, for work which needs more than one field at once"""
+        for start in xrange(0, len(self.records), size):
+            indices = np.arange(start, min(start + size, len(self.records)))
+            yield indices, self[indices]
+
+    def stats(self):
+        """returns the accumulate.StreamingStats over time at each gridpoint, made in one pass over the files"""
+        stats = accumulate.StreamingStats(self.shape[1:])
+        for field in self.fields():
+            stats.add(field)
+        return stats
+
+    def mean(self, axis=0):
+        """returns the mean over time (the only axis that can be reduced lazily)"""
+        if axis != 0:
+            raise ValueError("a LazyVariable can only be reduced over time (axis 0)")
+        return self.stats().mean()
+
+    def std(self, axis=0, ddof=0):
+        """returns the standard deviation over time"""
+        if axis != 0:
+            raise ValueError("a LazyVariable can only be reduced over time (axis 0)")
+        return self.stats().std(ddof)
+
+    def groupby_month(self):
+        """returns {month: accumulate.StreamingStats} over the years of each month there are files for, made in one pass over the files"""
+        stats = {}
+        for (year, month, filepath, size, mtime), field in itertools.izip(self.records, self.fields()):
+            stats.setdefault(month, accumulate.StreamingStats(self.shape[1:])).add(field)
+        return stats
+
+def month_map_mean(run, monthnum, varname, isice):
+    """the same as grab.month_map_mean for a ModelRun, i.e. only over the years, rows and dtype of the run. returns lons, lats, the mean
+    of varname over every year of the month and its units"""
+    myvar = run.variable(varname, isice)
+    return run.lons, run.lats, myvar.months([monthnum]).mean(), myvar.units
+
+def month_map_anom_multi(run, modelnames, months, varnames, isice, control=grab.CONTROL):
+    """the same as grab.month_map_anom_multi, over the years and rows of run (see ModelRun.like) for each model in modelnames and the control.
+    the control is only read once. returns lons, lats and dictionaries keyed by (modelname, varname, monthnum) of the anomaly maps (model - control)
+    and their totals weighted by gridcell area, as well as the units of each variable"""
+    controlrun = run.like(control)
+    units = {}
+    control_stats = {}
+    for varname in varnames:
+        controlvar = controlrun.variable(varname, isice)
+        units[varname] = controlvar.units
+        control_stats[varname] = controlvar.months(months).groupby_month()
+    anoms = {}
+    total_diffs = {}
+    for modelname in modelnames:
+        for varname in varnames:
+            stats = run.like(modelname).variable(varname, isice).months(months).groupby_month()
+            for monthnum in months:
+                anom = stats[monthnum].mean() - control_stats[varname][monthnum].mean()
+                anoms[(modelname, varname, monthnum)] = anom
+                total_diffs[(modelname, varname, monthnum)] = np.ma.sum(anom*controlrun.tarea)
+    return controlrun.lons, controlrun.lats, anoms, total_diffs, units
+
+def month_map_anom_test(run, monthnum, varname, isice, control=grab.CONTROL):
+    """the same as grab.month_map_anom_test for a ModelRun, with the control run over the same years and rows (see ModelRun.like). returns
+    lons, lats, the mean difference between the run and the control (run - control) in the month, its total weighted by gridcell area and the units"""
+    lons, lats, anoms, total_diffs, units = month_map_anom_multi(run, [run.modelname], [monthnum], [varname], isice, control)
+    key = (run.modelname, varname, monthnum)
+    return lons, lats, anoms[key], total_diffs[key], units[varname]
+
+def month_map_stddev(run, monthnum, varname):
+    """the same as grab.month_map_stddev for a ModelRun. returns lons, lats and the standard deviation of varname over every year of the month,
+    south of 50S"""
+    return grab._south_of_50(run.lons, run.lats, run[varname].months([monthnum]).std())
@@ -2,517 +2,555 @@
 import os
 from netCDF4 import Dataset
 import numpy as np
-import sys
+import itertools
+import collections
+import hashlib
+import cache
+import accumulate
+import grid
+import catalogue
+import prefetch
+import nsidc
+import store
+
+# extracted stacks are kept here so that re-runs don't decode the same NetCDF variables again. set to None to turn caching off.
+cube_cache = cache.CubeCache()
+# only the part of the grid south of this latitude is read from the model files. the maps are cut off at 55S, but their corners reach about 42S
+BOUNDINGLAT = -40.0
+# number of files read ahead on worker processes while the current one is being used. 0 reads every file in this process
+PREFETCH = 4
+# precision the loaders return fields in. 'float64' upcasts every field as it is read, 'native' keeps the precision of the files (float32 for CICE),
+# which halves the memory and cache space taken by stacks. upcasting float32 to float64 is exact and the reductions in here (climatologies, anomalies,
+# area and volume sums) accumulate in float64 in both modes, so they agree to float64 rounding (about 1e-16 relative). only float32 arithmetic done on
+# the returned fields differs: each operation rounds to about 6e-8 (2**-24) relative, so e.g. a float32 sum of n values is within n*6e-8 of the
+# float64 sum (numpy's pairwise summation usually does far better), which is why reductions of native stacks should ask for dtype='float64'
+DTYPE = 'float64'
+# ice concentration above which a cell counts towards the sea ice extent
+EXTENT_THRESHOLD = 0.15
+# totals making up the seasonal cycle, in the order seasonal_cycle stores them
+SEASONAL = ('area', 'extent', 'volume')
+# totals in the diagnostics tables: sea ice area, extent, ice volume and snow volume
+DIAGNOSTICS = ('area', 'extent', 'volume', 'snow')
+# regions the diagnostics are totalled over. 'global' is the whole grid, the rest are the part of it south of the equator between (west, east)
+# longitudes in degrees east, i.e. the whole southern hemisphere and the usual sectors of the southern ocean
+SECTORS = (("global", None), ("south", (0, 360)), ("weddell", (300, 20)), ("indian", (20, 90)), ("pacific", (90, 160)),
+           ("ross", (160, 230)), ("amundsen", (230, 300)))
+# diagnostics tables are stored on the local disk next to the cube cache
+TABLE_DIR = os.path.join(cache.CACHE_DIR, "tables")
+# the run every other model is compared against
+CONTROL = "u-at053"
+# masks of SECTORS on the grid of each model, by icedir
+_sector_masks = {}
+# climatologies of the control run as (stats, units), by (icedir, varname, monthnum, isice, rows.stop), so each is made once per run
+_control_climatologies = {}
+
+class DataRoot(object):
+    """where the data lives. models is the directory holding a directory for each model run (each with an ice directory of monthly files),
+    or the ice directory of a single model. nsidc is the directory of NSIDC data, with a folder for each month. the loaders build absolute paths
+    from this rather than changing directory, so they can be run for several models at once."""
+
+    def __init__(self, models, nsidc=None):
+        self.models = os.path.abspath(models)
+        if nsidc is None:
+            nsidc = os.path.join(self.models, "NSIDC_ben", "ice")
+        self.nsidc = os.path.abspath(nsidc)
+
+    def icedir(self, modelname):
+        """returns the directory holding the ice files of a model. if models is the ice directory of a single model, that model is the one named
+        by the directory above it (e.g. u-au866/ice), and asking for any other model (e.g. the control) is an error rather than handing back the same files"""
+        if os.path.basename(self.models) == "ice":
+            single = os.path.basename(os.path.dirname(self.models))
+            if modelname != single:
+                raise ValueError("{} only holds the files of {}, not {}".format(self.models, single, modelname))
+            return self.models
+        return os.path.join(self.models, modelname, "ice")
+
+    def __repr__(self):
+        return "DataRoot({!r}, {!r})".format(self.models, self.nsidc)
+
+def data_root(path):
+    """returns path as a DataRoot. path can already be one, or be the directory holding the model runs (or the ice directory of one)"""
+    if isinstance(path, DataRoot):
+        return path
+    return DataRoot(path)
+
+# where the data is by default, e.g. for the plots. can be set with the SEAICE_DATA environment variable
+DATA_ROOT = DataRoot(os.environ.get("SEAICE_DATA", "/media/windowsshare"))
 
 ######## SPECIFIC DATA GRABBING FUNCTIONS ###############################
 
-def ice_area_seasonal(path, modelname):
-    """grabs mean total sea ice area for each month given the name of model one wants and the path to the model files"""
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    filecount = len(os.listdir('./'))
-
-    # now we will sort the files based on month.
-    # assumes same number of files for each month
-    monthareas = np.ma.zeros([12, filecount/12], dtype='float64')
-    monthcount = np.zeros(12)
-    stdevs = np.ma.zeros(12, dtype='float64')
-    means = np.ma.zeros(12, dtype='float64')
-    maxes = np.ma.zeros(12, dtype='float64')
-    mins = np.ma.zeros(12, dtype='float64')
-    for filenum, filename in enumerate(os.listdir('./')):
-        print filename
-        testdata = Dataset(filename)
-        # now grabbing latitude just to check if we are in the southern hemisphere (some data is full world)
-        lats = np.ma.array(testdata.variables['TLAT'][:, :], dtype='float64')
-        cond = lats <= 0  # if we are below the equator, grab
-        if filenum == 0:
-            tarea = np.ma.array(
-                testdata.variables['tarea'][:, :], dtype='float64')[cond]
-        # grabbing month value from filename... format does not vary
-        monthstr = filename[19:21]
-        monthnum = int(monthstr)-1
-
-        print "the month we are grabbing is {}".format(monthstr)
-        print "Grabbing {}, file {} of {}".format(filename, filenum, filecount)
-        aice = np.ma.squeeze(np.ma.array(
-            testdata.variables['aice'][:, :], dtype='float64'))[cond]
-        # adding total ice area into its respective month bin
-        # catching weird error as one or two files are invalid
-        try:
-            monthareas[monthnum, monthcount[monthnum]] = np.ma.sum(aice*tarea)
-        except:
-            print "Error:", sys.exc_info()[0]
-        monthcount[monthnum] += 1 
+def diagnostics_table(path, modelname):
+    """returns the integrated diagnostics of every file of a model as a table of columns, i.e. a dict of arrays with one row per file sorted by date.
+    'year', 'month', 'path', 'size' and 'mtime' say which file a row is from, and '{sector}_{diagnostic}' hold the total of each of DIAGNOSTICS over
+    each of SECTORS, NaN for files which could not be used (and for snow if there is no hs). the table is stored in TABLE_DIR, and only files which
+    are new or have changed since are read, each one just once for all of the diagnostics."""
+    icedir = _icedir(path, modelname)
+    records = _catalogue(icedir).files()
+    names = ["{}_{}".format(sector, diagnostic) for sector, bounds in SECTORS for diagnostic in DIAGNOSTICS]
+    # changing the definitions of the diagnostics starts a new table
+    tablefile = os.path.join(TABLE_DIR, hashlib.sha1(repr((icedir, SECTORS, DIAGNOSTICS, EXTENT_THRESHOLD))).hexdigest() + ".npz")
+    known = {}
+    if os.path.exists(tablefile):
+        stored = np.load(tablefile)
+        rows = np.column_stack([stored[name] for name in names])
+        for filenum, (filepath, size, mtime) in enumerate(itertools.izip(stored['path'], stored['size'], stored['mtime'])):
+            known[(str(filepath), int(size), int(mtime))] = rows[filenum]
+    values = np.full((len(records), len(names)), np.nan)
+    new = []
+    for filenum, record in enumerate(records):
+        if tuple(record[2:]) in known:
+            values[filenum] = known[tuple(record[2:])]
+        else:
+            new.append(filenum)
+
+    tasks = [(icedir, records[filenum][2], DTYPE) for filenum in new]
+    if tasks:
+        # the grid and sector masks are loaded before the workers are forked so they all inherit them, rather than each reading
+        # (and caching) the grid at the same time
+        _sectors(icedir)
+    for count, (filenum, (totals, error)) in enumerate(itertools.izip(new, prefetch.prefetch(_file_diagnostics, tasks, PREFETCH))):
+        filepath = records[filenum][2]
+        print "Grabbing {}, file {} of {}".format(os.path.basename(filepath), count + 1, len(new))
+        if error is None:
+            values[filenum] = totals
+        else:
+            print "could not use {}, {}".format(filepath, error)
+
+    table = {"year": np.array([record[0] for record in records], dtype=int), "month": np.array([record[1] for record in records], dtype=int),
+             "path": np.array([record[2] for record in records], dtype=str), "size": np.array([record[3] for record in records], dtype='int64'),
+             "mtime": np.array([record[4] for record in records], dtype='int64')}
+    for column, name in enumerate(names):
+        table[name] = values[:, column]
+    if new or len(known) != len(records):
+        if not os.path.isdir(TABLE_DIR):
+            os.makedirs(TABLE_DIR)
+        # written under a temporary name first so that no other process can load a half written table
+        tempfile = "{}.{}".format(tablefile, os.getpid())
+        with open(tempfile, "wb") as File:
+            np.savez_compressed(File, **table)
+        os.rename(tempfile, tablefile)
+    return table
+
+def _file_diagnostics(task):
+    """returns (totals, None) with the total of each of DIAGNOSTICS over each of SECTORS for a file (sector by sector), or (None, reason) if
+    the file can not be used. task is (icedir, filepath, dtype) so that this can be run on a prefetch worker"""
+    icedir, filepath, dtype = task
+    tarea = _model_grid(icedir).tarea
+    try:
+        testdata = Dataset(filepath)
+    except (IOError, RuntimeError) as error:
+        return None, "{}: {}".format(type(error).__name__, error)
+    try:
+        everywhere = slice(None)
+        aice = _read(testdata, 'aice', everywhere, dtype)
+        # sithick is the thickness of the ice itself, CICE's hi the mean over the whole cell
+        if 'sithick' in testdata.variables:
+            thickness = aice*_read(testdata, 'sithick', everywhere, dtype)
+        else:
+            thickness = _read(testdata, 'hi', everywhere, dtype)
+        snow = None
+        if 'hs' in testdata.variables:
+            snow = _read(testdata, 'hs', everywhere, dtype)
+    except (IOError, RuntimeError, KeyError, ValueError) as error:
+        return None, "{}: {}".format(type(error).__name__, error)
+    finally:
         testdata.close()
-        # now converting to numpy array
-
-    # now calculating the mean for each month and returning that value, as well as the standard deviation for each month.
-    # first masking the mins value correctly so that it does not count "0" entries
-    [x, y] = monthareas.shape
-    for i in xrange(x):
-        for j in xrange(y):
-            if monthareas[i, j] == 0:
-                monthareas[i, j] = np.ma.masked
-
-    for i in xrange(12):
-        stdevs[i] = np.ma.std(monthareas[i, :])
-        means[i] = np.ma.mean(monthareas[i, :])
-        maxes[i] = np.ma.max(monthareas[i, :])
-        mins[i] = np.ma.min(monthareas[i, :])
+    if np.ma.getmaskarray(aice).all():
+        return None, "no valid ice data"
+    # tarea is float64, so the sums are done in float64 whatever dtype is
+    fields = {'area': aice*tarea, 'extent': np.ma.where(aice >= EXTENT_THRESHOLD, tarea, 0.0),
+              'volume': thickness*tarea, 'snow': None if snow is None else snow*tarea}
+    totals = []
+    for mask in _sectors(icedir).values():
+        for diagnostic in DIAGNOSTICS:
+            if fields[diagnostic] is None:
+                totals.append(np.nan)
+            else:
+                # a sector without any valid cells has no ice in it
+                totals.append(float(np.ma.filled(np.ma.sum(fields[diagnostic][mask]), 0.0)))
+    return totals, None
+
+def _sectors(icedir):
+    """returns the boolean masks of SECTORS on the grid of the model in icedir, in order"""
+    if icedir not in _sector_masks:
+        model = _model_grid(icedir)
+        lons = model.lons % 360
+        south = model.lats <= 0
+        masks = []
+        for sector, bounds in SECTORS:
+            if bounds is None:
+                masks.append((sector, np.ones(lons.shape, dtype=bool)))
+            elif bounds[0] < bounds[1]:
+                masks.append((sector, south & (lons >= bounds[0]) & (lons < bounds[1])))
+            else:
+                masks.append((sector, south & ((lons >= bounds[0]) | (lons < bounds[1]))))
+        _sector_masks[icedir] = collections.OrderedDict(masks)
+    return _sector_masks[icedir]
+
+def _month_column(path, modelname, monthnum, column):
+    """returns a list of the values of a column of the diagnostics table of a model for every year of a month, leaving out files which could not be used"""
+    table = diagnostics_table(path, modelname)
+    values = table[column][table['month'] == monthnum]
+    return list(values[~np.isnan(values)])
+
+def seasonal_cycle(path, modelname):
+    """returns the seasonal cycle of the total sea ice area, extent (the area of cells with at least EXTENT_THRESHOLD ice concentration) and volume
+    south of the equator, as (stats, valid, failed). stats[quantity] is a dict of the 'mean', 'std', 'max' and 'min' over the years of each month
+    (arrays of 12, masked for months without any valid files) along with the 'totals' of every month and year (12*years, masked where there is no
+    valid file) and the 'years' themselves. valid and failed hold the number of files of each month which were used and which could not be.
+    the totals come from the diagnostics table, so the files are only read the first time."""
+    table = diagnostics_table(path, modelname)
+    if not len(table['year']):
+        raise IOError("no monthly files in {}".format(_icedir(path, modelname)))
+    years = np.arange(table['year'].min(), table['year'].max() + 1)
+    # one column for each year, missing and unreadable files stay NaN
+    totals = np.full((len(SEASONAL), 12, len(years)), np.nan)
+    for quantity, monthtotals in zip(SEASONAL, totals):
+        monthtotals[table['month'] - 1, table['year'] - years[0]] = table['south_' + quantity]
+    used = ~np.isnan(table['south_area'])
+    valid = np.bincount(table['month'][used] - 1, minlength=12)
+    failed = np.bincount(table['month'][~used] - 1, minlength=12)
+
+    totals = np.ma.masked_invalid(totals)
+    stats = {}
+    for quantity, monthtotals in zip(SEASONAL, totals):
+        stats[quantity] = {"mean": monthtotals.mean(axis=1), "std": monthtotals.std(axis=1), "max": monthtotals.max(axis=1),
+                           "min": monthtotals.min(axis=1), "totals": monthtotals, "years": years}
+    return stats, valid, failed
 
-    return stdevs, means, maxes, mins
+def ice_area_seasonal(path, modelname):
+    """grabs mean total sea ice area for each month given the name of model one wants and the path to the model files,
+    returning the (standard deviation, mean, max, min) over the years of each month"""
+    stats = seasonal_cycle(path, modelname)[0]['area']
+    return stats['std'], stats['mean'], stats['max'], stats['min']
 
 def ice_volume_seasonal(path, modelname):
-    """grabs mean total sea ice volume for each month given the name of model one wants and the path to the model files"""
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    filecount = len(os.listdir('./'))
-
-    # now we will sort the files based on month.
-    # assumes same number of files for each month
-    monthvolumes = np.ma.zeros([12, filecount/12], dtype='float64')
-    monthcount = np.zeros(12)
-    stdevs = np.ma.zeros(12, dtype='float64')
-    means = np.ma.zeros(12, dtype='float64')
-    maxes = np.ma.zeros(12, dtype='float64')
-    mins = np.ma.zeros(12, dtype='float64')
-    for filenum, filename in enumerate(os.listdir('./')):
-        print filename
-        testdata = Dataset(filename)
-        # now grabbing latitude just to check if we are in the southern hemisphere (some data is full world)
-        lats = np.ma.array(testdata.variables['TLAT'][:, :], dtype='float64')
-        cond = lats <= 0  # if we are below the equator, grab
-        if filenum == 0:
-            tarea = np.ma.array(
-                testdata.variables['tarea'][:, :], dtype='float64')[cond]
-        # grabbing month value from filename... format does not vary
-        monthstr = filename[19:21]
-        monthnum = int(monthstr)-1
-
-        print "the month we are grabbing is {}".format(monthstr)
-        print "Grabbing {}, file {} of {}".format(filename, filenum, filecount)
-        aice = np.ma.squeeze(np.ma.array(
-            testdata.variables['aice'][:, :], dtype='float64'))[cond]
-        sithick = np.ma.squeeze(np.ma.array(
-            testdata.variables['sithick'][:,:],dtype='float64'))[cond]
-        # catching weird error as one or two files are invalid
-        try:
-            monthvolumes[monthnum, monthcount[monthnum]] = np.ma.sum(aice*tarea*sithick)
-        except:
-            print "Error:", sys.exc_info()[0]
-        monthcount[monthnum] += 1 
-        testdata.close()
-        # now converting to numpy array
-
-    # now calculating the mean for each month and returning that value, as well as the standard deviation for each month.
-    # first masking the mins value correctly so that it does not count "0" entries
-    [x, y] = monthvolumes.shape
-    for i in xrange(x):
-        for j in xrange(y):
-            if monthvolumes[i, j] == 0:
-                monthvolumes[i, j] = np.ma.masked
-
-    for i in xrange(12):
-        stdevs[i] = np.ma.std(monthvolumes[i, :])
-        means[i] = np.ma.mean(monthvolumes[i, :])
-        maxes[i] = np.ma.max(monthvolumes[i, :])
-        mins[i] = np.ma.min(monthvolumes[i, :])
-
-    return stdevs, means, maxes, mins
+    """grabs mean total sea ice volume for each month given the name of model one wants and the path to the model files,
+    returning the (standard deviation, mean, max, min) over the years of each month"""
+    stats = seasonal_cycle(path, modelname)[0]['volume']
+    return stats['std'], stats['mean'], stats['max'], stats['min']
 
 def ice_area_tseries(path, modelname):
-    """makes a time series plot of a certain model """
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-
-    # declaring array to hold ice areas for each timestep
-    ice_area = []
-
-    # sorting the files and appending the mean of each to an array
-    for i, filename in enumerate(sorted(os.listdir('./'))):
-        print filename  # just making sure we are grabbing files in order...
-        testdata = Dataset(filename)
-        if i == 0:
-            tarea = np.ma.array(
-                testdata.variables['tarea'][:, :], dtype='float64')
-        aice = np.ma.squeeze(np.ma.array(
-            testdata.variables['aice'][:, :], dtype='float64'))
-        ice_area.append(np.ma.sum(aice*tarea))
-        testdata.close()
-
-    # Now that we have all of the data we will return it
-    return ice_area
+    """returns the total sea ice area over the whole grid of a model for each of its files, NaN for files which could not be used"""
+    return list(diagnostics_table(path, modelname)['global_area'])
 
 def ice_area_month(path, modelname, monthnum):
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    ice_area = []
-    monthcount = 0
-
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            testdata = Dataset(filename)
-            # want to make sure we are in the southern hemisphere
-            lats = np.ma.array(
-                testdata.variables['TLAT'][:, :], dtype='float64')
-            cond = lats <= 0  # if out latitude is below the equator...
-            if monthcount == 0:
-                tarea = np.ma.array(
-                    testdata.variables['tarea'][:, :], dtype='float64')[cond]
-            aice = np.ma.squeeze(np.ma.array(
-                testdata.variables['aice'][:, :], dtype='float64'))[cond]
-            print "reached fine"
-            print "aice shape is {}".format(aice.shape)
-            print "tarea shape is {}".format(tarea.shape)
-            try:
-                ice_area.append(np.ma.sum(aice*tarea))
-                print "area added is {}".format(np.ma.sum(aice*tarea))
-            except:
-                print "Error:", sys.exc_info()[0]
-            monthcount += 1  # we have added the data for one month
-    return ice_area
+    """returns a list of the total sea ice area south of the equator for every year of a given month"""
+    return _month_column(path, modelname, monthnum, 'south_area')
 
 def ice_volume_month(path, modelname, monthnum):
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    ice_volume = []
-    monthcount = 0
-
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            testdata = Dataset(filename)
-            # want to make sure we are in the southern hemisphere
-            lats = np.ma.array(
-                testdata.variables['TLAT'][:, :], dtype='float64')
-            cond = lats <= 0  # if out latitude is below the equator...
-            if monthcount == 0:
-                tarea = np.ma.array(
-                    testdata.variables['tarea'][:, :], dtype='float64')[cond]
-            aice = np.ma.squeeze(np.ma.array(
-                testdata.variables['aice'][:, :], dtype='float64'))[cond]
-            sithick = np.ma.squeeze(np.ma.array(
-                testdata.variables['sithick'][:,:],dtype='float64'))[cond]
-            try:
-                ice_volume.append(np.ma.sum(aice*tarea))
-                print "volume added is {}".format(np.ma.sum(aice*tarea*sithick))
-            except:
-                print "Error:", sys.exc_info()[0]
-            monthcount += 1  # we have added the data for one month
-    return ice_volume
+    """returns a list of the total sea ice volume south of the equator for every year of a given month"""
+    return _month_column(path, modelname, monthnum, 'south_volume')
 
 #
 ############### GENERAL FUNCTIONS FOR DATA GRABBING ##################################
 
-def month_map_mean(path, modelname, monthnum, varname,isice):
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    monthcount = 0
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # latitude and longitude of grid cells does not change... also dims of myvar dont change
-                lats = np.ma.array(
-                    testdata.variables['TLAT'][:, :], dtype='float64')
-                lons = np.ma.array(
-                    testdata.variables['TLON'][:, :], dtype='float64')
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    cond = aice == 0
-                    myvar = np.ma.masked_where(cond,myvar)
-                myvar_total = []  # making total myvar
-                myvar_total.append(myvar)
-                #we want to grab the units from the netCDF file so that we can add them to the plot...
-                units = testdata.variables[varname].units 
-                testdata.close()
-                monthcount += 1
-            else:
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    aice = np.ma.squeeze(np.ma.array(
-                        testdata.variables['aice'][:,:], dtype='float64'))
-                    cond = aice == 0
-                    myvar = np.ma.masked_where(cond,myvar)
-                myvar_total.append(myvar)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-    #now taking mean of all datapoints
-    #first convert to np.ma array
-    myvar_total = np.ma.asarray(myvar_total)
-    means = myvar_total.mean(axis=0)
-    return lons, lats, means, units
-
-def month_map_anom_test(path, modelname, monthnum, varname,isice):
-    """this function loads in the control model (u-at053), and makes map plots of average monthly difference between it and a given model for a parameter."""
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    monthcount = 0
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # latitude and longitude of grid cells does not change... also dims of myvar dont change
-                print getattr(testdata,testdata.ncattrs()[7]) #just getting file history to make sure it is the right file
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                myvar = myvar[0:125,:]
-                aice = aice[0:125,:]
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    icecond = aice == 0
-                    print "icecond shape is {}, myvar shape is {}".format(icecond.shape,myvar.shape)
-                    myvar = np.ma.masked_where(icecond,myvar)
-                # now reshaping to be proper size
-                myvar_total = []
-                myvar_total.append(myvar)
-                units = testdata.variables[varname].units
-                testdata.close()
-                monthcount += 1
-            else:
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                myvar = myvar[0:125,:]
-                aice = aice[0:125,:]
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    icecond = aice == 0
-                    myvar = np.ma.masked_where(icecond,myvar)
-                myvar_total.append(myvar)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-    myvar_total = np.ma.asarray(myvar_total)
-    myvar_total_mean = myvar_total.mean(axis=0)
-
-    # now grabbing control model total amount of variable... "gridsize * value at each grid"
-    os.chdir("../../u-at053/ice/")
-    monthcount = 0
-    for filename in (sorted(os.listdir('./'))):
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing CONTROL: {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # dims of myvar dont change
-                lats = np.ma.squeeze(np.ma.array(
-                    testdata.variables['TLAT'][:, :], dtype='float64'))
-                tarea = np.ma.squeeze(np.ma.array(
-                    testdata.variables['tarea'][:, :], dtype='float64'))
-                lons = np.ma.squeeze(np.ma.array(
-                    testdata.variables['TLON'][:, :], dtype='float64'))
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                lats = lats[0:125,:]
-                tarea = tarea[0:125,:]
-                lons = lons[0:125,:]
-                myvar = myvar[0:125,:]
-                aice = aice[0:125,:]
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    icecond = aice == 0
-                    print "icecond shape is {}, myvar shape is {}".format(icecond.shape,myvar.shape)
-                    myvar = np.ma.masked_where(icecond,myvar)
-                myvar_total_control = []  # making total myvar
-                myvar_total_control.append(myvar)
-                testdata.close()
-                monthcount += 1
+def _icedir(path, modelname):
+    """returns the directory holding the ice files of a model. path can be a DataRoot, the directory holding all of the models or the ice directory itself"""
+    return data_root(path).icedir(modelname)
+
+def _catalogue(icedir):
+    """returns the catalogue.Catalogue of the files in icedir, which is only refreshed once per run"""
+    return catalogue.catalogue(icedir)
+
+def source_files(path, modelname, months):
+    """returns the full paths of the files of a model for the months in the list months"""
+    return _catalogue(_icedir(path, modelname)).paths(months)
+
+def cached(parts, sources, func):
+    """returns func(), going through cube_cache if caching is turned on"""
+    if cube_cache is None:
+        return func()
+    return cube_cache.cached(parts, sources, func)
+
+def _stack_key(icedir, varname, monthnum, isice, records, rows, dtype):
+    """returns the cube_cache key of the stack of every year of varname for a month, read from rows of the files in the catalogue records"""
+    return cube_cache.key((icedir, varname, monthnum, "all", isice, rows.stop, dtype), None, catalogue.signature(records))
+
+def _model_grid(icedir):
+    """returns the grid.Grid of the model files in icedir, which is only read once and kept in cube_cache"""
+    return grid.model_grid(icedir, cube_cache, _catalogue(icedir).paths()[0])
+
+def _rows(icedir, boundinglat=None):
+    """returns the slice of rows of the model grid in icedir which holds every point south of boundinglat (BOUNDINGLAT by default).
+    the grid starts at the south pole, so this is a single hyperslab which can be read straight from the files instead of reading the whole globe"""
+    if boundinglat is None:
+        boundinglat = BOUNDINGLAT
+    return _model_grid(icedir).rows(boundinglat)
+
+def _read(testdata, varname, rows, dtype=None):
+    """reads only the given rows of varname from an open file, with the time dimension squeezed out. the field is converted to dtype
+    (DTYPE by default), or kept as it is stored if dtype is 'native'"""
+    if dtype is None:
+        dtype = DTYPE
+    myvar = testdata.variables[varname][..., rows, :]
+    if dtype == 'native':
+        return np.ma.squeeze(np.ma.asarray(myvar))
+    return np.ma.squeeze(np.ma.array(myvar, dtype=dtype))
+
+def _read_fields(task):
+    """reads the rows of each variable in varnames from a file, returning dictionaries of their units and fields. if isice is False,
+    points with no ice are masked. task is (filepath, varnames, rows, isice, dtype) so that this can be run on a prefetch worker"""
+    filepath, varnames, rows, isice, dtype = task
+    print "grabbing {}".format(os.path.basename(filepath))
+    testdata = Dataset(filepath)
+    if isice == False:
+        #set all sections where there is no ice to NaN as there should be no data here...
+        cond = _read(testdata, 'aice', rows, dtype) == 0
+    units = {}
+    myvars = {}
+    for varname in varnames:
+        units[varname] = testdata.variables[varname].units
+        myvars[varname] = _read(testdata, varname, rows, dtype)
+        if isice == False:
+            myvars[varname] = np.ma.masked_where(cond, myvars[varname])
+    # making sure we don't have too many files open at once...
+    testdata.close()
+    return units, myvars
+
+def _prefetch(filepaths, varnames, rows, isice, dtype=None):
+    """yields (units, fields) as returned by _read_fields for each file in filepaths in order, with the next PREFETCH files being read ahead
+    (or from the model's store, see _read_tasks)"""
+    if dtype is None:
+        dtype = DTYPE
+    return _read_tasks([(filepath, varnames, rows, isice, dtype) for filepath in filepaths])
+
+def _read_tasks(tasks):
+    """returns an iterator over _read_fields(task) for each task in order, all of which have to be for the same model, rows, isice and dtype. the
+    fields come from the model's store (see store.py) if it is up to date with the files, otherwise from the files with PREFETCH being read ahead"""
+    if tasks:
+        filepath, varnames, rows, isice, dtype = tasks[0]
+        varnames = sorted(set(itertools.chain.from_iterable(task[1] for task in tasks)))
+        fields = store.read([task[0] for task in tasks], varnames, rows, isice, dtype)
+        if fields is not None:
+            # each file only hands back the variables it was asked for
+            return ((dict((varname, units[varname]) for varname in task[1]), dict((varname, myvars[varname]) for varname in task[1]))
+                    for task, (units, myvars) in itertools.izip(tasks, fields))
+    return prefetch.prefetch(_read_fields, tasks, PREFETCH)
+
+def gridcell_history(path, modelname, varname, j, i, isice=True):
+    """returns the years, months and values (a masked array) of varname at gridcell (j, i) for every file of a model. with a store
+    (see store.py) this is a few chunks of it, otherwise one read from every file"""
+    icedir = _icedir(path, modelname)
+    records = _catalogue(icedir).files()
+    filepaths = [record[2] for record in records]
+    fields = store.read(filepaths, [varname], slice(j, j + 1), isice, DTYPE, slice(i, i + 1))
+    if fields is not None:
+        values = [np.ma.ravel(myvars[varname])[0:1] for units, myvars in fields]
+    else:
+        values = [np.ma.ravel(myvars[varname])[i:i + 1] for units, myvars in _prefetch(filepaths, [varname], slice(j, j + 1), isice)]
+    years = np.array([record[0] for record in records], dtype=int)
+    months = np.array([record[1] for record in records], dtype=int)
+    return years, months, np.ma.concatenate(values)
+
+def month_map_multi(path, modelname, months, varnames, isice, boundinglat=None, dtype=None):
+    """grabs every variable in varnames for every month in months in a single pass over the files of a model, opening each file once.
+    returns lons, lats, a dictionary of stacks keyed by (varname, monthnum) where each stack is a time*lat*lon masked array,
+    and a dictionary of the units of each variable. if isice is False, points with no ice are masked.
+    only the rows of the grid south of boundinglat are read, in dtype (DTYPE by default). stacks which are already in cube_cache are memory mapped from there
+    instead of being read again."""
+    if dtype is None:
+        dtype = DTYPE
+    icedir = _icedir(path, modelname)
+    monthfiles = _catalogue(icedir).files(months)
+    rows = _rows(icedir, boundinglat)
+    stacks = {}
+    units = {}
+    keys = {}
+    for varname in varnames:
+        for monthnum in months:
+            if cube_cache is None:
+                keys[(varname, monthnum)] = None
+                continue
+            key = _stack_key(icedir, varname, monthnum, isice, _catalogue(icedir).files([monthnum]), rows, dtype)
+            entry = cube_cache.load(key)
+            if entry is None:
+                keys[(varname, monthnum)] = key
             else:
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                myvar = myvar[0:125,:]
-                aice = aice[0:125,:]
-                if isice==False:
-                    #if the variable is not aice, set all sections where there is no ice to NaN as there should be no data here...
-                    icecond = aice == 0
-                    print "icecond shape is {}, myvar shape is {}".format(icecond.shape,myvar.shape)
-                    myvar = np.ma.masked_where(icecond,myvar)
-                myvar_total_control.append(myvar)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-    myvar_total_control = np.ma.asarray(myvar_total_control)
-    myvar_total_control_mean = myvar_total_control.mean(axis=0)
-
-    # convention is model - control
-    # total myvar difference by gridpoint
-    myvar_diff = myvar_total_mean - myvar_total_control_mean
-    # now finding the total difference in m^2
-    total_diff = np.ma.sum(myvar_diff*tarea)
+                stacks[(varname, monthnum)] = entry[0]
+                units[varname] = entry[1]["units"]
+    # now reading whatever was not cached
+    readvars = sorted(set(varname for varname, monthnum in keys))
+    readmonths = set(monthnum for varname, monthnum in keys)
+    for varname, monthnum in keys:
+        stacks[(varname, monthnum)] = []
+    # each file is only asked for the variables which are missing for its month
+    tasks = [(filepath, [varname for varname in readvars if (varname, monthnum) in keys], rows, isice, dtype)
+             for year, monthnum, filepath, size, mtime in monthfiles if monthnum in readmonths]
+    months_read = [monthnum for year, monthnum, filepath, size, mtime in monthfiles if monthnum in readmonths]
+    for monthnum, (fileunits, myvars) in itertools.izip(months_read, _read_tasks(tasks)):
+        units.update(fileunits)
+        for varname in myvars:
+            stacks[(varname, monthnum)].append(myvars[varname])
+    #first convert to np.ma arrays
+    for varname, monthnum in keys:
+        stacks[(varname, monthnum)] = np.ma.asarray(stacks[(varname, monthnum)])
+        if keys[(varname, monthnum)] is not None:
+            cube_cache.save(keys[(varname, monthnum)], stacks[(varname, monthnum)], {"units": units[varname]})
+    return _model_grid(icedir).lons[rows], _model_grid(icedir).lats[rows], stacks, units
+
+def month_map_climatology_multi(path, modelname, months, varnames, isice, boundinglat=None):
+    """accumulates the statistics (mean, variance, min, max and count) at each gridpoint over every year of a month, for every variable in varnames and
+    month in months, in a single pass over the files. memory use does not grow with the length of the run. returns lons, lats, a dictionary of
+    accumulate.StreamingStats keyed by (varname, monthnum) and a dictionary of the units of each variable. if isice is False, points with no ice are left out.
+    only the rows of the grid south of boundinglat are read. statistics are cached, and made from the cached stack of a variable instead of the files if there is one.
+    the statistics are always accumulated in float64, fields are only read in DTYPE to save memory on the way."""
+    dtype = DTYPE
+    icedir = _icedir(path, modelname)
+    rows = _rows(icedir, boundinglat)
+    lons, lats = _model_grid(icedir).lons[rows], _model_grid(icedir).lats[rows]
+    stats = {}
+    units = {}
+    keys = {}
+    for varname in varnames:
+        for monthnum in months:
+            if cube_cache is None:
+                keys[(varname, monthnum)] = None
+                continue
+            records = _catalogue(icedir).files([monthnum])
+            key = cube_cache.key((icedir, varname, monthnum, "climatology", isice, rows.stop), None, catalogue.signature(records))
+            entry = cube_cache.load(key)
+            if entry is not None:
+                stats[(varname, monthnum)] = accumulate.StreamingStats.from_array(entry[0])
+                units[varname] = entry[1]["units"]
+                continue
+            stack = cube_cache.load(_stack_key(icedir, varname, monthnum, isice, records, rows, DTYPE))
+            if stack is not None:
+                stats[(varname, monthnum)] = accumulate.StreamingStats().update(stack[0])
+                units[varname] = stack[1]["units"]
+                cube_cache.save(key, stats[(varname, monthnum)].to_array(), {"units": units[varname]})
+                continue
+            keys[(varname, monthnum)] = key
+    # now reading whatever was not cached, each file is only asked for the variables which are missing for its month
+    readvars = sorted(set(varname for varname, monthnum in keys))
+    readmonths = set(monthnum for varname, monthnum in keys)
+    for varname, monthnum in keys:
+        stats[(varname, monthnum)] = accumulate.StreamingStats()
+    monthfiles = _catalogue(icedir).files(sorted(readmonths))
+    tasks = [(filepath, [varname for varname in readvars if (varname, monthnum) in keys], rows, isice, dtype)
+             for year, monthnum, filepath, size, mtime in monthfiles]
+    months_read = [monthnum for year, monthnum, filepath, size, mtime in monthfiles]
+    # only a few fields are held at once, however long the run is
+    for monthnum, (fileunits, myvars) in itertools.izip(months_read, _read_tasks(tasks)):
+        units.update(fileunits)
+        for varname in myvars:
+            stats[(varname, monthnum)].add(myvars[varname])
+    for varname, monthnum in keys:
+        if keys[(varname, monthnum)] is not None:
+            cube_cache.save(keys[(varname, monthnum)], stats[(varname, monthnum)].to_array(), {"units": units[varname]})
+    return lons, lats, stats, units
+
+def month_map_climatology(path, modelname, monthnum, varname, isice, boundinglat=None):
+    """returns lons, lats, the accumulate.StreamingStats of varname over every year of a month, and the units of the variable. see month_map_climatology_multi"""
+    lons, lats, stats, units = month_map_climatology_multi(
+        path, modelname, [monthnum], [varname], isice, boundinglat)
+    return lons, lats, stats[(varname, monthnum)], units[varname]
+
+def _climatology_task(task):
+    """runs month_map_climatology_multi for task = (path, modelname, months, varnames, isice, boundinglat) and returns the statistics packed into arrays
+    along with the units, so that it can be run on a worker process"""
+    lons, lats, stats, units = month_map_climatology_multi(*task)
+    return dict((key, stats[key].to_array()) for key in stats), units
+
+def control_climatology(path, months, varnames, isice, boundinglat=None, control=CONTROL):
+    """returns a dictionary of the (stats, units) of the control run keyed by (varname, monthnum), made the first time each is asked for and then
+    kept for the rest of the run"""
+    controldir = _icedir(path, control)
+    rows = _rows(controldir, boundinglat)
+    memokeys = dict(((varname, monthnum), (controldir, varname, monthnum, isice, rows.stop)) for varname in varnames for monthnum in months)
+    missing = [key for key in memokeys if memokeys[key] not in _control_climatologies]
+    if missing:
+        lons, lats, stats, units = month_map_climatology_multi(
+            path, control, sorted(set(monthnum for varname, monthnum in missing)), sorted(set(varname for varname, monthnum in missing)), isice, boundinglat)
+        for varname, monthnum in stats:
+            _control_climatologies[memokeys.get((varname, monthnum), (controldir, varname, monthnum, isice, rows.stop))] = \
+                (stats[(varname, monthnum)], units[varname])
+    return dict((key, _control_climatologies[memokeys[key]]) for key in memokeys)
 
+def month_map_mean(path, modelname, monthnum, varname,isice):
+    lons, lats, stats, units = month_map_climatology(
+        path, modelname, monthnum, varname, isice)
+    #now taking mean of all datapoints
+    return lons, lats, stats.mean(), units
+
+def month_map_anom_multi(path, modelnames, months, varnames, isice, boundinglat=None, control=CONTROL):
+    """calculates the average monthly difference between each model in modelnames and the control for every variable in varnames and month in months.
+    the climatology of the control is only made once per run (see control_climatology), and the models are loaded at the same time on worker processes.
+    returns lons, lats and dictionaries keyed by (modelname, varname, monthnum) of the anomaly maps and the total differences (weighted by gridcell area),
+    as well as the units of each variable. only the grid south of boundinglat is read."""
+    controldir = _icedir(path, control)
+    rows = _rows(controldir, boundinglat)
+    lons, lats, tarea = _model_grid(controldir).lons[rows], _model_grid(controldir).lats[rows], _model_grid(controldir).tarea[rows]
+    # the control is made (or found in memory) while the models load
+    tasks = [(path, modelname, months, varnames, isice, boundinglat) for modelname in modelnames]
+    models = prefetch.prefetch(_climatology_task, tasks, len(tasks))
+    try:
+        control_stats = control_climatology(path, months, varnames, isice, boundinglat, control)
+    except BaseException:
+        # (including KeyboardInterrupt) the models would otherwise carry on loading until the interpreter exits
+        models.close()
+        raise
+    units = dict((varname, control_stats[(varname, monthnum)][1]) for varname, monthnum in control_stats)
+    anoms = {}
+    total_diffs = {}
+    for modelname, (stats, model_units) in itertools.izip(modelnames, models):
+        for key in stats:
+            # convention is model - control
+            # total myvar difference by gridpoint
+            myvar_diff = accumulate.StreamingStats.from_array(stats[key]).mean() - control_stats[key][0].mean()
+            anoms[(modelname,) + key] = myvar_diff
+            # now finding the total difference in m^2
+            total_diffs[(modelname,) + key] = np.ma.sum(myvar_diff*tarea)
+    return lons, lats, anoms, total_diffs, units
+
+def month_map_anom_test(path, modelname, monthnum, varname,isice, control=CONTROL):
+    """this function loads in the control model (CONTROL, u-at053, by default), and makes map plots of average monthly difference between it and a given model for a parameter."""
+    lons, lats, anoms, total_diffs, units = month_map_anom_multi(
+        path, [modelname], [monthnum], [varname], isice, control=control)
+    key = (modelname, varname, monthnum)
     # now returning the lon,lat and anomaly of myvar
-    return lons, lats, myvar_diff, total_diff, units
+    return lons, lats, anoms[key], total_diffs[key], units[varname]
 
 def month_map_stddev(path, modelname, monthnum, varname):
     """given a path to a model, the name of the model and a number denoting a month, calculate the std_dev of the variable given for that month at each gridpoint"""
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    monthcount = 0
-    varlist = []
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # dims of aice dont change
-                lats = np.ma.array(
-                    testdata.variables['TLAT'][:, :], dtype='float64')
-                cond = lats < -50.0
-                # now grabbing the variable we want
-                lons = np.ma.array(
-                    testdata.variables['TLON'][:, :], dtype='float64')[cond]
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))[cond]
-                lats = lats[cond]
-                # size should be the same for all of them...
-                size = myvar.shape[0]
-                # now reshaping to be proper size
-                myvar = np.reshape(myvar, [int(size/360.0), 360])
-                lats = np.reshape(lats, [int(size/360.0), 360])
-                lons = np.reshape(lons, [int(size/360.0), 360])
-                varlist.append(myvar)
-                testdata.close()
-                monthcount += 1
-            else:
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[str(varname)][:, :], dtype='float64'))[cond]
-                myvar = np.reshape(myvar, [int(size/360.0), 360])
-                varlist.append(myvar)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-
-    # now we will calculate the standard deviation of the variable list and return it
-    varlist = np.asarray(varlist)
-    return lons, lats, np.std(varlist, axis=0)
-
-
-def month_map_data(path, modelname, monthnum, varname):
-    """grabs and returns a stack of arrays for the value of varname for model modelname during a given month"""
-    os.chdir("../../../../")
-    os.chdir(path)
-    monthcount = 0
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # latitude and longitude of grid cells does not change... only want bottom part of world data (i.e want 125x360 slice. (so that all data are the same dimensions when we do the mean)
-                lats = np.ma.array(
-                    testdata.variables['TLAT'][:,:], dtype='float64')
-                lons = np.ma.array(
-                    testdata.variables['TLON'][:,:], dtype='float64')
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[varname][:,:], dtype='float64'))
-                lats = lats[0:125,:]
-                lons = lons[0:125,:]
-                myvar = myvar[0:125,:]
-                myvar_total = []  # making total myvar
-                myvar_total.append(myvar)
-                testdata.close()
-                monthcount += 1
-            else:
-                myvar = np.ma.squeeze(np.ma.array(
-                    testdata.variables[varname][:, :], dtype='float64'))
-                myvar = myvar[0:125,:]
-                myvar_total.append(myvar)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-    #now taking mean of all datapoints
-    #first convert to np.ma array
-    myvar_total = np.ma.asarray(myvar_total)
-    return lons, lats, myvar_total
+    lons, lats, stats, units = month_map_climatology(
+        path, modelname, monthnum, varname, True)
+    return _south_of_50(lons, lats, stats.std())
+
+def _south_of_50(lons, lats, myvar):
+    """returns lons, lats and myvar at only the gridpoints south of 50S, as rows of 360"""
+    cond = lats < -50.0
+    size = np.sum(cond)
+    # now reshaping to be proper size
+    lons = np.reshape(lons[cond], [int(size/360.0), 360])
+    myvar = np.reshape(myvar[cond], [int(size/360.0), 360])
+    lats = np.reshape(lats[cond], [int(size/360.0), 360])
+    return lons, lats, myvar
+
+
+def month_map_data(path, modelname, monthnum, varname, boundinglat=None, dtype=None):
+    """grabs and returns a stack of arrays for the value of varname for model modelname during a given month, south of boundinglat, in dtype (see DTYPE)"""
+    lons, lats, stacks, units = month_map_multi(
+        path, modelname, [monthnum], [varname], True, boundinglat, dtype)
+    return lons, lats, stacks[(varname, monthnum)]
 
 def month_map_test(path, modelname,varname):
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
+    icedir = _icedir(path, modelname)
     monthcount = 0
-    files=sorted(os.listdir('./'))
     #we want the first file
-    filename = files[0]
-    print "grabbing {}".format(filename)
+    filename = _catalogue(icedir).paths()[0]
+    print "grabbing {}".format(os.path.basename(filename))
+    rows = _rows(icedir)
+    lons, lats, tarea, landmask = _model_grid(icedir).region(BOUNDINGLAT)
     testdata = Dataset(filename)
-    lats = np.ma.array(
-        testdata.variables['TLAT'][:, :], dtype='float64')
-    lons = np.ma.array(
-        testdata.variables['TLON'][:, :], dtype='float64')
-    myvar = np.ma.squeeze(np.ma.array(
-        testdata.variables[str(varname)][:, :], dtype='float64'))
-    tarea = np.ma.squeeze(np.ma.array(
-        testdata.variables[str(varname)][:, :], dtype='float64'))
+    myvar = _read(testdata, str(varname), rows)
     testdata.close()
-    return lons[0:125,:], lats[0:125,:], myvar[0:125,:], tarea[0:125,:]
+    return lons, lats, myvar, tarea
 
 def ice_area_map_mean(path, modelname, monthnum):
-    os.chdir("../../../../")
-    os.chdir("{}/{}/{}".format(path, modelname, "ice"))
-    monthcount = 0
-    for filename in (sorted(os.listdir('./'))):
-        # grabbing month from filename
-        monthstr = filename[19:21]
-        # we only want the files of a certain month given by monthnum
-        if int(monthstr) == monthnum:
-            print "grabbing {}".format(filename)
-            testdata = Dataset(filename)
-            if monthcount == 0:  # latitude and longitude of grid cells does not change... only want bottom part of world data (i.e want 125x360 slice. (so that all data are the same dimensions when we do the mean)
-                lats = np.ma.array(
-                    testdata.variables['TLAT'][:,:], dtype='float64')
-                lons = np.ma.array(
-                    testdata.variables['TLON'][:,:], dtype='float64')
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:,:], dtype='float64'))
-                lats = lats[0:125,:]
-                lons = lons[0:125,:]
-                aice = aice[0:125,:]
-                icearea_total = []  # making total myvar
-                icearea_total.append(aice)
-                testdata.close()
-                monthcount += 1
-            else:
-                aice = np.ma.squeeze(np.ma.array(
-                    testdata.variables['aice'][:, :], dtype='float64'))
-                aice = aice[0:125,:]
-                icearea_total.append(aice)
-                # making sure we don't have too many files open at once...
-                testdata.close()
-                monthcount += 1  # we have added the data for one month.
-    #now taking mean of all datapoints
-    #first convert to np.ma array
-    icearea_total = np.ma.asarray(icearea_total)
-    means = icearea_total.mean(axis=0)
-    return lons, lats, means
+    lons, lats, stats, units = month_map_climatology(
+        path, modelname, monthnum, 'aice', True)
+    return lons, lats, stats.mean()
 
 def NSIDC_data(path,month):
     #function to grab ice concentration data downloaded from the NSIDC database and return it.
@@ -520,52 +558,59 @@ def NSIDC_data(path,month):
     #directory should have structure 
     """
             ./monthnum1/ folder with net cdf files for month # monthnum1 
-            ./lats.dat
+            ./lats.dat (if not there, the copy which comes with the repo is used)
             ./lons.dat
             ./monthnum2/ folder with netcdf files for month # monthnum2
+            or instead of the month folders, a store made from the geotiffs by nsidc.ingest_tiffs, ./concentration.nc
+
+    returns lons, lats, the stack of concentrations (time*x*y, each field masked over land and scaled by its own maximum) and their mean
     """
-    
-    os.chdir(path)
-    
-    #grabbing lats and lons from datafiles.. they should be in parent directory
-    latlon = []
-    for filename in ['lats.dat','lons.dat']:
-        x,y = [316,332] #setting shape
-        data = np.fromfile(filename,dtype='int32',count=x*y) 
-        array = np.reshape(data, [x,y],order='F')
-        latlon.append(array)
-    lats = latlon[0]
-    lons = latlon[1]
-    lats = lats/100000.0
-    lons = lons/100000.0
- 
+    if isinstance(path, DataRoot):
+        path = path.nsidc
+    if not os.path.exists(os.path.join(path, 'lats.dat')):
+        nsidcgrid = nsidc.grid()
+    else:
+        nsidcgrid = nsidc.grid(path)
+    lons, lats = nsidcgrid.lons, nsidcgrid.lats
+
     #now we want the ice concentration files
-    os.chdir(month) 
-    icedata = []
-    for filename in sorted(os.listdir("./")):
-        testdata = Dataset(filename)
-        aice = np.ma.squeeze(np.ma.array(testdata.variables['Band1'][:,:], dtype='float32'))
-        #Band 1 is (y,x) not (x,y).
-        aice = np.transpose(aice)
-        [x,y] = np.shape(aice)
-        for i in range(x):
-            aice[i,:] = np.flip(aice[i,:])
-        icedata.append(aice)        
- 
+    storefile = os.path.join(path, nsidc.STORE)
+    if os.path.exists(storefile):
+        #the store only reads this month, and is (y,x) north up like the geotiffs so it just needs transposing
+        years, fields = nsidc.store_month(storefile, int(month))
+        icedata = np.ma.array(fields, dtype='float32').transpose(0, 2, 1)
+    else:
+        monthdir = os.path.join(path, month)
+        fields = []
+        for filename in sorted(os.listdir(monthdir)):
+            testdata = Dataset(os.path.join(monthdir, filename))
+            fields.append(np.ma.squeeze(np.ma.array(testdata.variables['Band1'][:,:], dtype='float32')))
+            testdata.close()
+        #Band 1 is (y,x) not (x,y), and each row runs the wrong way, which is fixed on the whole stack at once
+        icedata = np.ma.stack(fields).transpose(0, 2, 1)[:, :, ::-1]
+
     #take the mean for concentration
-    icemean = np.mean(icedata,axis=0)
-    
+    icemean = np.ma.mean(icedata, axis=0)
+
     #need to remove masked points which are above a certain maximum
     #all points about 1500 correspond to land mass
-    icemean = np.ma.masked_where(icemean>1500,icemean)    
+    icemean = np.ma.masked_greater(icemean, 1500)
     #normalizing
     icemean = 1.0 / (np.max(icemean)) * icemean
 
-    #now doing the same for icedata (stack of aice arrays....)
-    icedata_masked = []
-    for arr in icedata:
-        arr = np.ma.masked_where(arr>1500,arr)
-        arr = 1.0 / (np.max(arr)) * arr
-        icedata_masked.append(arr)
-        
-    return lons, lats, icedata_masked, icemean
+    #now doing the same for icedata, each field scaled by its own maximum
+    icedata = np.ma.masked_greater(icedata, 1500)
+    icedata = icedata / icedata.max(axis=(1, 2))[:, np.newaxis, np.newaxis]
+
+    return lons, lats, icedata, icemean
+
+def NSIDC_sources(path, month):
+    """returns the list of files NSIDC_data reads the concentrations of a month from, i.e. the store if there is one and the files in the month's
+    folder otherwise, e.g. to key cached results made from them"""
+    if isinstance(path, DataRoot):
+        path = path.nsidc
+    storefile = os.path.join(path, nsidc.STORE)
+    if os.path.exists(storefile):
+        return [storefile]
+    monthdir = os.path.join(path, str(month))
+    return [os.path.join(monthdir, filename) for filename in sorted(os.listdir(monthdir))]
@@ -0,0 +1,87 @@
+"""registry of model grids. the coordinates, cell areas and land mask of a model run are the same in every one of its files, so they are read once per model and shared."""
+import os
+import numpy as np
+from netCDF4 import Dataset
+import regridder
+
+# grids which have already been loaded, by ice directory and by fingerprint
+_by_dir = {}
+_by_fingerprint = {}
+
+class Grid(object):
+    """the lats, lons, cell areas (tarea, in m^2) and land mask (true on land) of a model grid, as read only arrays of shape (nj, ni).
+    the grid starts at the south pole, so the region south of any latitude is a block of rows, which region() hands out views of.
+    the fingerprint is a hash of the arrays, equal for any two models on the same grid."""
+
+    def __init__(self, lats, lons, tarea, landmask, fingerprint=None):
+        self.lats = lats
+        self.lons = lons
+        self.tarea = tarea
+        self.landmask = landmask
+        for array in (self.lats, self.lons, self.tarea, self.landmask):
+            if array.flags.writeable:
+                array.flags.writeable = False
+        if fingerprint is None:
+            fingerprint = regridder.grid_key(lats, lons, tarea, landmask)
+        self.fingerprint = fingerprint
+        self._rows = {}
+
+    def rows(self, boundinglat):
+        """returns the slice of rows which holds every point south of boundinglat. raises ValueError if there are none"""
+        if boundinglat not in self._rows:
+            south = np.flatnonzero((self.lats <= boundinglat).any(axis=1))
+            if not len(south):
+                raise ValueError("no point of the grid is at or south of boundinglat {} (the grid starts at {:.2f})".format(
+                    boundinglat, self.lats.min()))
+            self._rows[boundinglat] = slice(0, south.max() + 1)
+        return self._rows[boundinglat]
+
+    def region(self, boundinglat):
+        """returns views of (lons, lats, tarea, landmask) for the rows south of boundinglat"""
+        rows = self.rows(boundinglat)
+        return self.lons[rows], self.lats[rows], self.tarea[rows], self.landmask[rows]
+
+    def to_array(self):
+        """packs the grid into a single (4*nj*ni) array, e.g. to store it in the cube cache"""
+        return np.array([self.lats, self.lons, self.tarea, self.landmask], dtype='float64')
+
+def read_grid(filename):
+    """reads the grid from a model file. the land mask is taken from tmask if the file has it, otherwise from the mask of aice"""
+    testdata = Dataset(filename)
+    arrays = [np.ma.getdata(np.ma.squeeze(np.ma.array(testdata.variables[name][:, :], dtype='float64')))
+              for name in ('TLAT', 'TLON', 'tarea')]
+    if 'tmask' in testdata.variables:
+        landmask = np.squeeze(testdata.variables['tmask'][:, :]) == 0
+    else:
+        landmask = np.ma.getmaskarray(np.ma.squeeze(testdata.variables['aice'][:, :]))
+    testdata.close()
+    lats, lons, tarea = arrays
+    return Grid(lats, lons, tarea, np.asarray(landmask, dtype=bool))
+
+def model_grid(icedir, cubecache=None, filename=None):
+    """returns the Grid of the model files in icedir, reading it from filename (the first file by default) the first time it is asked for. if cubecache
+    (a cache.CubeCache) is given, the grid is also kept there between runs. a grid with the same fingerprint as one already loaded
+    is swapped for that one, so models on the same grid share their arrays."""
+    if icedir in _by_dir:
+        return _by_dir[icedir]
+    if filename is None:
+        filename = os.path.join(icedir, sorted(os.listdir(icedir))[0])
+    model = None
+    if cubecache is not None:
+        key = cubecache.key((icedir, "grid"), [filename])
+        entry = cubecache.load(key)
+        if entry is not None:
+            array, attrs = entry
+            model = Grid(array[0], array[1], array[2], array[3] > 0.5, attrs["fingerprint"])
+    if model is None:
+        print "grabbing grid from {}".format(filename)
+        model = read_grid(filename)
+        if cubecache is not None:
+            cubecache.save(key, model.to_array(), {"fingerprint": model.fingerprint})
+    model = _by_fingerprint.setdefault(model.fingerprint, model)
+    _by_dir[icedir] = model
+    return model
+
+def same_grid(icedir1, icedir2, cubecache=None):
+    """returns true if the models in the two ice directories are on the same grid"""
+    return model_grid(icedir1, cubecache).fingerprint == model_grid(icedir2, cubecache).fingerprint
@@ -2,7 +2,6 @@ import grab
 import process
 import numpy as np
 import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
 import scipy
 from scipy import stats
 import os
@@ -22,9 +21,8 @@ if __name__=="__main__":
         print np.shape(lons), np.shape(lats), np.shape(aice)
         #grabbing model data
         lons_model,lats_model,aice_model = grab.ice_area_map_mean("/media/windowsshare",model,2)  
-        inds = (lons_model>180.)
+        lons_model = lons_model - 360.0*(lons_model>180.)
         lons_new = lons_model
-        lons_new[inds] = lons_model[inds] - 360.0
         
         #PRINTING TOTAL NUMBER OF POINTS THAT ARE NOT MASKED IN EITHER ARRAY
         print np.sum(aice>0)
@@ -43,23 +41,17 @@ if __name__=="__main__":
             print "arrays loaded successfully"
         except:
             print "regridded arrays are not already stored.. need to create them for the first time"
-            aice_model_stack_regrid = []
-            aice_stack_regrid = []
-            #now need to regrid all 
-        
-            for array in aice_model_stack:
-                aice_model_temp, NSIDC_placeholder, anom, glons, glats = process.regrid(array,lats_model,lons_model,aice_stack[0],lats,lons,"u-at053","2")
-                aice_stack_regrid.append(aice_model_temp)
-            for array in aice_stack:
-                aice_model_placeholder, NSIDC_temp, anom, glons, glats = process.regrid(aice_model_stack[0],lats_model,lons_model,array,lats,lons,"u-at053","2")
-                aice_model_stack_regrid.append(NSIDC_temp)
+            #now need to regrid all, each dataset is regridded as one stack
+            [ny,nx] = np.shape(aice_model_stack[0])
+            glons,glats = process.target_grid(nx,ny)
+            aice_stack_regrid, gmask = process.regrid_stack(aice_model_stack,lats_model,lons_model,glons,glats)
+            aice_model_stack_regrid, NSIDC_gmask = process.regrid_stack(aice_stack,lats,lons,glons,glats)
             np.save('/media/windowsshare/NSIDC_ben/aice_model_stack_regrid.npy',aice_model_stack_regrid)
             np.save('/media/windowsshare/NSIDC_ben/aice_stack_regrid.npy',aice_stack_regrid)
         
         #first testing that the arrays I've grabbed are actually fine
         fig,ax=plt.subplots(figsize=(8,8))
-        m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+        m = plot.antarctic_map()
         m.drawmapboundary(fill_color='grey')
         cs=m.pcolormesh(lons,lats,aice_stack[i],latlon=True)
         plt.clim(0,1.0)
@@ -71,8 +63,7 @@ if __name__=="__main__":
     
         #first testing that the arrays I've grabbed are actually fine
         fig,ax=plt.subplots(figsize=(8,8))
-        m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+        m = plot.antarctic_map()
         m.drawmapboundary(fill_color='grey')
         cs=m.pcolormesh(lons_stack,lats_stack,aice_model_stack[0],latlon=True)
         plt.clim(0,1.0)
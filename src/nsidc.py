@@ -0,0 +1,148 @@
+"""the NSIDC 25km south polar stereographic grid, from the lats.dat, lons.dat and pss25area_v3.dat files NSIDC hands out with its sea ice
+concentrations (see https://nsidc.org/data/polar-stereo/tools_geo_pixel.html). each file is 316*332 little endian int32 values in fortran order.
+
+also turns a directory of NSIDC monthly concentration geotiffs into a single store, which can be run on python 2 or 3 (needs gdal) as
+    python nsidc.py tiffdir [storefile]"""
+import os
+import re
+import sys
+import numpy as np
+from netCDF4 import Dataset
+
+# shape of the grid, (x, y), the same as the fields NSIDC_data returns
+SHAPE = (316, 332)
+# the file of each array and what its values have to be divided by: lats and lons are stored in 1e-5 degrees, areas in 1e-3 km^2
+FILES = {'lats': ('lats.dat', 1e5), 'lons': ('lons.dat', 1e5), 'area': ('pss25area_v3.dat', 1e3)}
+# the repo keeps a copy of the grid files at its top level
+GRID_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# the monthly concentration geotiffs are named e.g. S_199109_concentration_v3.0.tif, copies of a file get a "(1)" on the end
+TIFF_NAME = re.compile(r"^S_(\d{4})(\d{2})_concentration_v[\d.]+\s*(\(\d+\))?\.tif$")
+# name of the store in the NSIDC directory, which NSIDC_data reads if it is there
+STORE = "concentration.nc"
+# value of the store for months without a file
+STORE_FILL = 65535
+
+# grids which have already been opened, by directory
+_grids = {}
+
+class Grid(object):
+    """the lats, lons (degrees) and cell areas (km^2) of the NSIDC grid in griddir, as read only arrays of SHAPE. the files are memory mapped
+    rather than read, so a file is only touched once its array is used (and pss25area_v3.dat need not be there unless area is), and the scaled
+    arrays are only made once per grid."""
+
+    def __init__(self, griddir=GRID_DIR):
+        self.griddir = os.path.abspath(griddir)
+        self._raw = {}
+        self._scaled = {}
+
+    def raw(self, name):
+        """returns the values of the file of name ('lats', 'lons' or 'area') as stored, memory mapped straight from the file"""
+        if name not in self._raw:
+            self._raw[name] = np.memmap(os.path.join(self.griddir, FILES[name][0]), dtype='<i4', mode='r', shape=SHAPE, order='F')
+        return self._raw[name]
+
+    def _get(self, name):
+        if name not in self._scaled:
+            array = np.asarray(self.raw(name))/FILES[name][1]
+            array.flags.writeable = False
+            self._scaled[name] = array
+        return self._scaled[name]
+
+    @property
+    def lats(self):
+        return self._get('lats')
+
+    @property
+    def lons(self):
+        return self._get('lons')
+
+    @property
+    def area(self):
+        return self._get('area')
+
+    def ice_area(self, conc):
+        """returns the total sea ice area (km^2) of a concentration field (x*y, as a fraction) or of each field of a stack (time*x*y), leaving out
+        masked cells. as the model totals are in m^2, multiply by 1e6 to compare"""
+        return np.ma.sum(np.ma.asarray(conc)*self.area, axis=(-2, -1))
+
+def grid(griddir=GRID_DIR):
+    """returns the Grid of the files in griddir, which is only opened once per process"""
+    griddir = os.path.abspath(griddir)
+    if griddir not in _grids:
+        _grids[griddir] = Grid(griddir)
+    return _grids[griddir]
+
+def index_tiffs(tiffdir):
+    """returns {(year, month): path} for the concentration geotiffs in tiffdir, along with a list of the paths which were left out because
+    another file has the same month. of those, the file without a "(1)" style suffix is kept"""
+    found = {}
+    for filename in sorted(os.listdir(tiffdir)):
+        match = TIFF_NAME.match(filename)
+        if match is not None:
+            key = (int(match.group(1)), int(match.group(2)))
+            found.setdefault(key, []).append((match.group(3) is not None, filename))
+    index = {}
+    duplicates = []
+    for key, copies in found.items():
+        copies.sort()
+        index[key] = os.path.join(tiffdir, copies[0][1])
+        duplicates.extend(os.path.join(tiffdir, filename) for copy, filename in copies[1:])
+    return index, sorted(duplicates)
+
+def ingest_tiffs(tiffdir, storefile=None, complevel=4):
+    """decodes every concentration geotiff in tiffdir once and writes them to storefile (STORE in tiffdir by default), a compressed NetCDF4
+    file holding concentration(year, month, y, x) as uint16 in the units of the geotiffs, chunked one field at a time so that any month
+    can be sliced out without reading the rest. months without a file are STORE_FILL, and so come out masked. returns the path of the store"""
+    # only needed here, so the rest of the module works without gdal
+    from osgeo import gdal
+    if storefile is None:
+        storefile = os.path.join(tiffdir, STORE)
+    index, duplicates = index_tiffs(tiffdir)
+    if not index:
+        raise IOError("no concentration geotiffs in {}".format(tiffdir))
+    for path in duplicates:
+        print("leaving out {}, there is already a file for that month".format(path))
+    keys = sorted(index)
+    years = np.arange(keys[0][0], keys[-1][0] + 1)
+    first = gdal.Open(index[keys[0]])
+    ny, nx = first.RasterYSize, first.RasterXSize
+
+    # written under a temporary name first so that no one can open a half written store
+    tempfile = "{}.{}".format(storefile, os.getpid())
+    store = Dataset(tempfile, "w", format="NETCDF4")
+    try:
+        store.createDimension("year", len(years))
+        store.createDimension("month", 12)
+        store.createDimension("y", ny)
+        store.createDimension("x", nx)
+        store.createVariable("year", "i4", ("year",))[:] = years
+        store.createVariable("month", "i4", ("month",))[:] = np.arange(1, 13)
+        conc = store.createVariable("concentration", "u2", ("year", "month", "y", "x"), zlib=True, complevel=complevel,
+                                    shuffle=True, chunksizes=(1, 1, ny, nx), fill_value=STORE_FILL)
+        conc.units = "0.1 percent"
+        conc.comment = "as in the geotiffs, north up: 0-1000 is concentration, 2510 pole hole, 2530 coast, 2540 land, 2550 missing"
+        store.source = tiffdir
+        for filenum, (year, month) in enumerate(keys):
+            print("decoding {}, file {} of {}".format(os.path.basename(index[(year, month)]), filenum + 1, len(keys)))
+            raster = gdal.Open(index[(year, month)]).GetRasterBand(1).ReadAsArray()
+            conc[year - years[0], month - 1] = raster
+    finally:
+        store.close()
+    os.rename(tempfile, storefile)
+    return storefile
+
+def store_month(storefile, month):
+    """returns the years and the masked (year, y, x) stack of concentrations for a month from a store made by ingest_tiffs, leaving out
+    years without a file. only the fields of that month are read"""
+    store = Dataset(storefile)
+    try:
+        years = store.variables["year"][:]
+        fields = np.ma.asarray(store.variables["concentration"][:, month - 1, :, :])
+    finally:
+        store.close()
+    present = ~np.ma.getmaskarray(fields).all(axis=(1, 2))
+    return np.asarray(years)[present], fields[present]
+
+if __name__ == "__main__":
+    ingest_tiffs(*sys.argv[1:])
@@ -0,0 +1,45 @@
+"""checks that process.permutation_test_stack gives the same p values as running mlxtend's permutation_test on the history of each gridcell,
+the way comparison_main.gridcell_history used to. the stacks are random, but rounded so that there are plenty of ties, and have masked cells"""
+import sys
+import numpy as np
+from mlxtend.evaluate import permutation_test
+import process
+
+def random_stack(rng, t, x, y):
+    """returns a t*x*y masked stack of concentrations rounded to 0.1 (so values tie), with whole gridcells masked (land) and odd masked entries"""
+    stack = np.round(rng.uniform(0.0, 1.0, [t, x, y]), 1)
+    mask = rng.uniform(size=[t, x, y]) < 0.05
+    mask[:, 0, 0] = True
+    # a gridcell with the same value every year, so every permutation ties with the reference
+    stack[:, 1, 1] = 0.5
+    mask[:, 1, 1] = False
+    return np.ma.masked_array(stack, mask)
+
+def mlxtend_pvals(array_stack_1, array_stack_2, num_rounds, seed):
+    """the per-gridcell loop which permutation_test_stack replaced"""
+    [x, y] = np.shape(array_stack_1[0])
+    pvals = np.zeros([x, y])
+    for i in range(x):
+        for j in range(y):
+            array_stack_1_sample = np.asarray([arr[i, j] for arr in array_stack_1])
+            array_stack_2_sample = np.asarray([arr[i, j] for arr in array_stack_2])
+            pvals[i, j] = permutation_test(array_stack_1_sample, array_stack_2_sample,
+                                           method='approximate', num_rounds=num_rounds, seed=seed)
+    return pvals
+
+def check(t1, t2, x, y, num_rounds=200, seed=0):
+    """compares the two on random stacks of t1 and t2 fields of x*y, returning True if every p value is the same"""
+    rng = np.random.RandomState(t1*1000 + t2)
+    stack1 = random_stack(rng, t1, x, y)
+    stack2 = random_stack(rng, t2, x, y)
+    expected = mlxtend_pvals(stack1, stack2, num_rounds, seed)
+    # a small chunksize so that the grid is split over several chunks
+    pvals = process.permutation_test_stack(stack1, stack2, num_rounds, seed, chunksize=7)
+    same = np.array_equal(pvals, expected)
+    print "{} and {} fields of {}*{}: {}".format(t1, t2, x, y, "same p values" if same else
+                                                 "{} p values differ".format(np.sum(pvals != expected)))
+    return same
+
+if __name__=="__main__":
+    results = [check(20, 20, 6, 5), check(20, 40, 4, 7), check(7, 3, 5, 5, seed=3)]
+    sys.exit(0 if all(results) else 1)
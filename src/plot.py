@@ -3,6 +3,7 @@
 # IMPORT LIBRARIES
 import grab
 import process
+import dataset
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
@@ -10,9 +11,47 @@ import scipy
 from scipy import stats
 import os
 import sys
+import pickle
+import json
+import multiprocessing
+import cache
 from scipy.interpolate import griddata
 from mlxtend.evaluate import permutation_test
 
+# the antarctic map is built once per process and pickled here between runs
+MAP_DIR = os.path.join(cache.CACHE_DIR, "maps")
+_maps = {}
+
+def antarctic_map(resolution='h'):
+    """returns the south polar stereographic Basemap used for all of the map plots. building it reads and projects the whole coastline
+    database, so it is only done once per process, and the map is pickled to disk so later runs can just load it. the map keeps its
+    projected coastlines and (once drawlsmask has been called) its projected land-sea mask, so every figure drawn with it reuses them"""
+    if resolution not in _maps:
+        picklefile = os.path.join(MAP_DIR, "spstere_{}.pickle".format(resolution))
+        try:
+            with open(picklefile, "rb") as File:
+                m = pickle.load(File)
+        except (IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            print "building {} resolution map for the first time".format(resolution)
+            m = Basemap(resolution=resolution, projection='spstere',
+                        lat_0=-90, lon_0=-180, boundinglat=-55)
+            # projecting the land-sea mask now so that it is stored with the map
+            fig = plt.figure()
+            m.drawlsmask(land_color='grey', ocean_color='grey', lakes=True)
+            plt.close(fig)
+            if not os.path.isdir(MAP_DIR):
+                os.makedirs(MAP_DIR)
+            # written under a temporary name first so that no other process can load a half written map
+            tempfile = "{}.{}".format(picklefile, os.getpid())
+            with open(tempfile, "wb") as File:
+                pickle.dump(m, File, -1)
+            os.rename(tempfile, picklefile)
+        _maps[resolution] = m
+    m = _maps[resolution]
+    # the map boundary patch belongs to the last figure drawn, so each new figure needs its own
+    m._mapboundarydrawn = False
+    return m
+
 ######## SPECIFIC DATA GRABBING FUNCTIONS ###############################
 
 def ice_area_seasonal_main_all():
@@ -23,7 +62,7 @@ def ice_area_seasonal_main_all():
     fig, ax = plt.subplots(figsize=(8, 8))
     for i, model in enumerate(models):
         tempstd, tempmean, tempmax, tempmin = grab.ice_area_seasonal(
-            "/media/windowsshare", "u-{}".format(model))
+            grab.DATA_ROOT, "u-{}".format(model))
         print "the minimum areas are {}".format(tempmin)
         plt.plot(range(1, 13), tempmean,label=model)
         plt.xlabel('Months of the year')
@@ -42,7 +81,7 @@ def ice_volume_seasonal_main_all():
     fig, ax = plt.subplots(figsize=(8, 8))
     for i, model in enumerate(models):
         tempstd, tempmean, tempmax, tempmin = grab.ice_volume_seasonal(
-            "/media/windowsshare", "u-{}".format(model))
+            grab.DATA_ROOT, "u-{}".format(model))
         print "the minimum volumes are {}".format(tempmin)
         plt.plot(range(1, 13), tempmean,label=model)
         plt.xlabel('Months of the year')
@@ -61,7 +100,7 @@ def ice_volume_seasonal_main():
     fig, ax = plt.subplots(figsize=(8, 8))
     for i, model in enumerate(models):
         tempstd, tempmean, tempmax, tempmin = grab.ice_volume_seasonal(
-            "/media/windowsshare", "u-{}".format(model))
+            grab.DATA_ROOT, "u-{}".format(model))
         print "the minimum volumes are {}".format(tempmin)
         plt.plot(range(1, 13), tempmean,label=model)
         plt.xlabel('Months of the year')
@@ -81,7 +120,7 @@ def ice_area_seasonal_main():
     fig, ax = plt.subplots(figsize=(8, 8))
     for i, model in enumerate(models):
         tempstd, tempmean, tempmax, tempmin = grab.ice_area_seasonal(
-            "/media/windowsshare", "u-{}".format(model))
+            grab.DATA_ROOT, "u-{}".format(model))
         print "the minimum areas are {}".format(tempmin)
         plt.plot(range(1, 13), tempmean,label=model)
         plt.xlabel('Months of the year')
@@ -95,7 +134,7 @@ def ice_area_seasonal_main():
 
 def ice_area_tseries_main():
     """makes a nice time series plot for ice area of a given model..."""
-    ice_area = grab.ice_area_tseries("/media/windowsshare", "u-at053")
+    ice_area = grab.ice_area_tseries(grab.DATA_ROOT, "u-at053")
     plt.plot(ice_area)
     plt.title("Sea ice area from 1990-2009 for control model")
     plt.xlabel("Time (months)")
@@ -108,7 +147,7 @@ def ice_area_month_main(modelname,monthnum):
     monthdict = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun',
              7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
     ice_area = grab.ice_area_month(
-        "/media/windowsshare",modelname,monthnum)
+        grab.DATA_ROOT,modelname,monthnum)
     print ice_area
     plt.title("Sea ice area runs of control model {}\nIn the month of {}, year 2000 forcing".format(
         modelname,monthdict[monthnum]))
@@ -126,7 +165,7 @@ def ice_area_month_main_all(monthnum):
     fig, ax = plt.subplots(figsize=(8, 8))
     for model in ["u-at053", "u-au866","u-au872","u-au874","u-av231"]:
         ice_area = grab.ice_area_month(
-            "/media/windowsshare",model,monthnum)
+            grab.DATA_ROOT,model,monthnum)
         print ice_area
         plt.title("Sea ice area runs of all models\nIn the month of {}, year 2000 forcing".format(
             monthdict[monthnum]))
@@ -142,7 +181,7 @@ def ice_volume_month_main(modelname,monthnum):
     monthdict = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun',
              7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
     ice_volume = grab.ice_volume_month(
-        "/media/windowsshare",modelname,monthnum)
+        grab.DATA_ROOT,modelname,monthnum)
     print ice_volume
     plt.title("Sea ice volume runs of control model {}\nIn the month of {}, year 2000 forcing".format(
         modelname,monthdict[monthnum]))
@@ -160,7 +199,7 @@ def ice_volume_month_main_all(monthnum):
     fig,ax = plt.subplots(figsize=(8,8))
     for model in ["u-at053", "u-au866","u-au872","u-au874","u-av231"]:
         ice_volume = grab.ice_volume_month(
-            "/media/windowsshare",model,monthnum)
+            grab.DATA_ROOT,model,monthnum)
         print ice_volume
         plt.title("Sea ice volume runs of all models\nIn the month of {}, year 2000 forcing".format(
             monthdict[monthnum]))
@@ -174,16 +213,22 @@ def ice_volume_month_main_all(monthnum):
 ############### GENERAL FUNCTIONS FOR MAP PLOTTING ##################################
 
 
-def month_map_mean_main(modelname,monthnum,varname,csvdir,isice):
-    """function called when map plots of mean of variable varname are wanted..."""
+def month_map_mean_main(modelname,monthnum,varname,csvdir,isice,data=None,outdir="/home/ben/Desktop/mapplots"):
+    """function called when map plots of mean of variable varname are wanted... data can be given as (lons,lats,means,units) if it has already been grabbed.
+    modelname can also be a dataset.ModelRun, whose years, rows and dtype the mean is then taken over. the figure is saved in outdir"""
+    if isinstance(modelname, dataset.ModelRun):
+        if data is None:
+            data = dataset.month_map_mean(modelname, monthnum, varname, isice)
+        modelname = modelname.modelname
     #dictionary to set limits on some plots manually as outliers obscure detail of data. quick fix, will change later
     limitdict = {"ardg":[0.0,0.72],"fhocn_ai":[-80.0,0],"fsurf_ai":[-60.0,0],"siflcondtop":[-80.0,0.0],"siflsensupbot":[-2400.0,0],"sihc":[-1.6e9,0.0], "sithick":[0,6], "dardg1dt":[0,5], "opening":[0,12.5]}
-    lons, lats, myvar,units = grab.month_map_mean(
-        "/media/windowsshare",modelname,monthnum,varname,isice)  # grabbing data
+    if data is None:
+        data = grab.month_map_mean(
+            grab.DATA_ROOT,modelname,monthnum,varname,isice)  # grabbing data
+    lons, lats, myvar, units = data
     #now saving limits of plot to csv file so that month_map_anom_main can use them
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawlsmask(land_color='grey',ocean_color='grey',lakes=True)
     m.drawmapboundary(linewidth=1)
@@ -204,17 +249,27 @@ def month_map_mean_main(modelname,monthnum,varname,csvdir,isice):
     except:
         print "this variable does not have preset plot limits. Allowing matplotlib to set them."
     fig.savefig(
-        '/home/ben/Desktop/mapplots/{}_{}_{}'.format(modelname, varname, monthnum))
+        os.path.join(outdir, '{}_{}_{}'.format(modelname, varname, monthnum)))
     plt.close()
 
-def month_map_anom_main(modelname, monthnum, varname,csvdir,isice):
-    """function called when anomaly map plots of variable varname are wanted..."""
-    lons, lats, myvar, total_diff, units = grab.month_map_anom_test(
-        "/media/windowsshare", modelname, monthnum, varname,isice)  # grabbing data
+def month_map_anom_main(modelname, monthnum, varname,csvdir,isice,data=None,outdir="/home/ben/Desktop",control=grab.CONTROL):
+    """function called when anomaly map plots of variable varname (against the model control) are wanted... data can be given as (lons,lats,anomaly,total_diff,units)
+    if it has already been grabbed. modelname can also be a dataset.ModelRun, which is then compared with the control over the same years and rows.
+    the figure is saved in outdir"""
+    #the plot limits are made over the same data as the anomaly
+    path = grab.DATA_ROOT
+    if isinstance(modelname, dataset.ModelRun):
+        path = modelname
+        if data is None:
+            data = dataset.month_map_anom_test(path, monthnum, varname, isice, control)
+        modelname = path.modelname
+    if data is None:
+        data = grab.month_map_anom_test(
+            path, modelname, monthnum, varname,isice,control)  # grabbing data
+    lons, lats, myvar, total_diff, units = data
     print("total difference in variable {} is {}".format(varname,total_diff))
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawmapboundary(linewidth=1)
     m.drawlsmask(land_color='grey', ocean_color='grey', lakes=True)
@@ -234,27 +289,128 @@ def month_map_anom_main(modelname, monthnum, varname,csvdir,isice):
     except:
         #If they haven't been generated, generate then read them
         print "error with reading limits.. attemping to create limits"
-        process.anom_limit_setup(varname,[2,9],["u-au866","u-au872","u-au874","u-av231"],csvdir)
+        process.anom_limit_setup(varname,[2,9],["u-au866","u-au872","u-au874","u-av231"],csvdir,path,control)
         lims = process.read_lims(varname,csvdir)
     print lims
     plt.clim(float(lims["Min"]),float(lims["Max"]))
     plt.show()
     fig.savefig(
-        '/home/ben/Desktop/{}-{}-{}'.format(modelname, varname, monthnum))
+        os.path.join(outdir, '{}-{}-{}'.format(modelname, varname, monthnum)))
     plt.close()
 
+######## BATCH RENDERING ###############################################
+
+# file names each kind of batch plot is saved under, the same as month_map_mean_main and month_map_anom_main use
+_render_names = {"mean": "{}_{}_{}.png", "anom": "{}-{}-{}.png"}
+
+def _render_init():
+    """runs in each render worker (and in the process running the batch). the figures are only saved, so there is no need for an interactive backend (and plt.show() does not block)"""
+    plt.switch_backend('Agg')
+
+def _render_sources(path, kind, modelname, monthnum, varname, csvdir, control):
+    """returns the list of files a figure is made from. anomaly plots also depend on the control run and on the plot limits file,
+    which render_batch makes before working out any stamps"""
+    sources = grab.source_files(path, modelname, [monthnum])
+    if kind == "anom":
+        sources += grab.source_files(path, control, [monthnum])
+        sources.append(os.path.join(csvdir, "{}.txt".format(varname)))
+    return sources
+
+def _render_stamp(path, job, csvdir, isice, control):
+    """returns a description of everything that goes into the figure for job. the figure only needs redrawing if this changes"""
+    kind, modelname, monthnum, varname = job
+    sources = _render_sources(path, kind, modelname, monthnum, varname, csvdir, control)
+    return {"job": list(job), "isice": isice, "files": cache.file_signature(sources)}
+
+def _render_warm(args):
+    """grabs every variable and month a model is needed for in one pass, so the render workers find them in the cube cache"""
+    path, modelname, months, varnames, isice = args
+    grab.month_map_climatology_multi(path, modelname, months, varnames, isice)
+    return modelname
+
+def _render_job(args):
+    """draws and saves the figure for a single job, then writes its stamp next to it"""
+    path, job, outdir, csvdir, isice, control, stamp = args
+    kind, modelname, monthnum, varname = job
+    if kind == "mean":
+        month_map_mean_main(modelname, monthnum, varname, csvdir, isice, outdir=outdir,
+                            data=grab.month_map_mean(path, modelname, monthnum, varname, isice))
+    elif kind == "anom":
+        month_map_anom_main(modelname, monthnum, varname, csvdir, isice, outdir=outdir, control=control,
+                            data=grab.month_map_anom_test(path, modelname, monthnum, varname, isice, control))
+    else:
+        raise ValueError("unknown plot kind {}".format(kind))
+    plt.close('all')
+    stampfile = os.path.join(outdir, _render_names[kind].format(modelname, varname, monthnum) + ".json")
+    with open(stampfile, "w") as File:
+        json.dump(stamp, File)
+    return job
+
+def render_batch(jobs, outdir, csvdir, isice=False, path=grab.DATA_ROOT, control=grab.CONTROL, workers=None, force=False):
+    """renders a list of jobs (plot kind, modelname, monthnum, varname), where kind is "mean" or "anom", into outdir on a pool of
+    worker processes using the Agg backend. anomalies are against control. a figure is skipped if it was already rendered from the same input
+    files (unless force is true). plot limits which are missing from csvdir are made first, from the anomaly jobs of each variable.
+    returns the list of jobs which were rendered"""
+    outdir = os.path.abspath(outdir)
+    csvdir = os.path.abspath(csvdir)
+    for directory in [outdir, csvdir]:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    # the limits are made here rather than by each worker, so they are only made once and the stamps already include them
+    anoms = {}
+    for kind, modelname, monthnum, varname in jobs:
+        if kind == "anom":
+            models, months = anoms.setdefault(varname, (set(), set()))
+            models.add(modelname)
+            months.add(monthnum)
+    for varname, (models, months) in sorted(anoms.items()):
+        if not os.path.exists(os.path.join(csvdir, "{}.txt".format(varname))):
+            print "making plot limits for {}".format(varname)
+            process.anom_limit_setup(varname, sorted(months), sorted(models), csvdir, path, control)
+    todo = []
+    for job in jobs:
+        kind, modelname, monthnum, varname = job
+        stamp = _render_stamp(path, job, csvdir, isice, control)
+        stampfile = os.path.join(outdir, _render_names[kind].format(modelname, varname, monthnum) + ".json")
+        if not force and os.path.exists(stampfile):
+            with open(stampfile) as File:
+                if json.load(File) == json.loads(json.dumps(stamp)):
+                    continue
+        todo.append((path, job, outdir, csvdir, isice, control, stamp))
+    print "rendering {} of {} figures, the rest are up to date".format(len(todo), len(jobs))
+    if not todo:
+        return []
+    # which months and variables each model (and the control, for anomalies) is needed for
+    needed = {}
+    for path, (kind, modelname, monthnum, varname), outdir, csvdir, isice, control, stamp in todo:
+        for model in [modelname, control] if kind == "anom" else [modelname]:
+            months, varnames = needed.setdefault(model, (set(), set()))
+            months.add(monthnum)
+            varnames.add(varname)
+    # building the map (headless) before the workers are forked so that they all share it
+    _render_init()
+    antarctic_map()
+    pool = multiprocessing.Pool(workers, initializer=_render_init)
+    try:
+        pool.map(_render_warm, [(path, model, sorted(months), sorted(varnames), isice)
+                                for model, (months, varnames) in sorted(needed.items())], chunksize=1)
+        done = pool.map(_render_job, todo, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return done
+
 def month_map_anom_volume(modelname, monthnum):
     """function called when anomaly map plots of variable varname are wanted..."""
     lons, lats, aice, total_diff_aice, units = grab.month_map_anom_test(
-        "/media/windowsshare", modelname, monthnum, "aice", True)  # grabbing data
+        grab.DATA_ROOT, modelname, monthnum, "aice", True)  # grabbing data
     print("total difference in variable {} is {}".format("aice",total_diff_aice))
     lons, lats, sithick, total_diff_sithick, units = grab.month_map_anom_test(
-        "/media/windowsshare", modelname, monthnum, "sithick", False)
-    lonstest, latstest, myvartest, tarea = grab.month_map_test("/media/windowsshare",modelname,"aice")
+        grab.DATA_ROOT, modelname, monthnum, "sithick", False)
+    lonstest, latstest, myvartest, tarea = grab.month_map_test(grab.DATA_ROOT,modelname,"aice")
     concentration = np.multiply(aice,tarea)
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawmapboundary(linewidth=1)
     m.drawlsmask(land_color='grey', ocean_color='grey', lakes=True)
@@ -269,12 +425,15 @@ def month_map_anom_volume(modelname, monthnum):
     plt.close()
 
 def month_map_variance_main(modelname, monthnum, varname):
-    """plots the variance of a seasonal variable myvar for a given model and month"""
-    lons, lats, myvar = grab.month_map_stddev(
-        "/media/windowsshare", modelname, monthnum, varname)
+    """plots the variance of a seasonal variable myvar for a given model (a name or a dataset.ModelRun, over its own years and rows) and month"""
+    if isinstance(modelname, dataset.ModelRun):
+        lons, lats, myvar = dataset.month_map_stddev(modelname, monthnum, varname)
+        modelname = modelname.modelname
+    else:
+        lons, lats, myvar = grab.month_map_stddev(
+            grab.DATA_ROOT, modelname, monthnum, varname)
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.fillcontinents(color='grey')
     m.drawmapboundary(linewidth=1)
@@ -291,12 +450,20 @@ def month_map_variance_main(modelname, monthnum, varname):
         '/home/ben/Desktop/varplots/{}-{}-{}'.format(modelname, varname, monthnum))
 
 
-def t_test_main(modelname, monthnum, varname, pval_filter, t_or_p):
-    """performs the student's t-test on each gridpoint. if t_or_p is true, plots the t-statistic scalar field, else plots the p value."""
-    lons, lats, modelvar = grab.month_map_data(
-        "/media/windowsshare", modelname, monthnum, varname)
-    lons, lats, controlvar = grab.month_map_data(
-        "/media/windowsshare", "u-at053", monthnum, varname)
+def t_test_main(modelname, monthnum, varname, pval_filter, t_or_p, control=grab.CONTROL):
+    """performs the student's t-test on each gridpoint against the model control. if t_or_p is true, plots the t-statistic scalar field, else plots the p value.
+    if modelname is a dataset.ModelRun the run and the control are streamed through rather than read in"""
+    if isinstance(modelname, dataset.ModelRun):
+        run = modelname
+        modelname = run.modelname
+        lons, lats = run.lons, run.lats
+        modelvar = run[varname].months([monthnum])
+        controlvar = run.like(control)[varname].months([monthnum])
+    else:
+        lons, lats, modelvar = grab.month_map_data(
+            grab.DATA_ROOT, modelname, monthnum, varname)
+        lons, lats, controlvar = grab.month_map_data(
+            grab.DATA_ROOT, control, monthnum, varname)
     #formatting info for plot title based on whether we want to plot tstat or pvalue
     if t_or_p:
         varstring = "tstatistic"
@@ -306,8 +473,7 @@ def t_test_main(modelname, monthnum, varname, pval_filter, t_or_p):
         plotinfo = ""
     result = process.t_test_gridpoint(lons,lats,modelvar,controlvar,pval_filter,t_or_p)
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawlsmask(land_color='grey', ocean_color='aqua', lakes=True)
     m.drawmapboundary(linewidth=1)
@@ -329,9 +495,9 @@ def t_test_area_main(modelname, monthnum, varname, latrange, lonrange, outputdir
     method of double checking, and then writes the result of each t-test to a file ttests.txt
     in directory given by outputdir"""
     lons, lats, modelvar = grab.month_map_mean(
-        "/media/windowsshare", modelname, monthnum, varname)
+        grab.DATA_ROOT, modelname, monthnum, varname)
     lons1, lats1, controlvar = grab.month_map_mean(
-        "/media/windowsshare", "u-at053", monthnum, varname)
+        grab.DATA_ROOT, "u-at053", monthnum, varname)
     latmin = latrange[0]
     latmax = latrange[1]
     lonmin = lonrange[0]
@@ -351,16 +517,14 @@ def t_test_area_main(modelname, monthnum, varname, latrange, lonrange, outputdir
 
     # now we will plot these to see if they make sense
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawlsmask(land_color='grey', ocean_color='aqua', lakes=True)
     m.drawmapboundary(linewidth=1)
     cm = m.pcolormesh(lons, lats, modelvar_masked, latlon=True, cmap='Reds')
     plt.title("{} in selected area for {}".format(varname, modelname))
     plt.show()
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawlsmask(land_color='grey', ocean_color='aqua', lakes=True)
     m.drawmapboundary(linewidth=1)
@@ -392,9 +556,9 @@ def scatterplot_area_main(modelname, monthnum, varname, latrange, lonrange, outp
     spatial property and treats them as a sequence of data. Then creates a scatterplot of the two arrays
     and saves figure in a given output directory outputdir"""
     lons, lats, modelvar = grab.ice_area_map_mean(
-        "/media/windowsshare",modelname,monthnum)
+        grab.DATA_ROOT,modelname,monthnum)
     lons1, lats1, controlvar = grab.ice_area_map_mean(
-        "/media/windowsshare","u-at053",monthnum)
+        grab.DATA_ROOT,"u-at053",monthnum)
     latmin = latrange[0]
     latmax = latrange[1]
     lonmin = lonrange[0]
@@ -451,11 +615,10 @@ def plot(input_x, input_y, xlab, ylab, title, plotarr, std_devs, maxes, mins):
 def testplot(modelname,varname):
     """function called to test whether or not grabbing functions are grabbing correct data, comparing to Panoply plots..."""
     lons, lats, myvar = grab.month_map_test(
-        "/media/windowsshare",modelname,varname)  # grabbing data
+        grab.DATA_ROOT,modelname,varname)  # grabbing data
     #now saving limits of plot to csv file so that month_map_anom_main can use them
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawcoastlines(linewidth=1)
     m.drawlsmask(land_color='grey',ocean_color='grey',lakes=True)
     m.drawmapboundary(linewidth=1)
@@ -468,18 +631,17 @@ def plot_area_main(modelname, monthnum, outputdir,xlim,ylim):
     """plots the selected snow + ice thickness for the given area"""
     #grabbing sea ice thickness
     lons, lats, sithick, units = grab.month_map_mean(
-        "/media/windowsshare", modelname, monthnum, "hi",True)
+        grab.DATA_ROOT, modelname, monthnum, "hi",True)
     #grabbing snow thickness 
     lons, lats, sisnthick, units = grab.month_map_mean(
-        "/media/windowsshare", modelname, monthnum, "hs",True)
+        grab.DATA_ROOT, modelname, monthnum, "hs",True)
     totalthick= sithick + sisnthick
     print np.ma.mean(sithick)
     print np.ma.mean(sisnthick)
     
     #now we will make the plot
     fig, ax = plt.subplots(figsize=(8, 8))
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawmapboundary(linewidth=0.3)
     cm = m.pcolormesh(lons, lats, totalthick, latlon=True, cmap='gist_rainbow')
     cbar = m.colorbar(cm, location='bottom', pad="5%")
@@ -494,16 +656,15 @@ def plot_area_main(modelname, monthnum, outputdir,xlim,ylim):
 def plot_all(modelname,monthnum,var1,varcond,xlim,ylim,var2="aice"):
     """plots all files of a model for a given variable and saves to an output directory. Optionally plots varname+varname2 if varcond==True"""
     if varcond:
-        lons,lats,vars1,varnames1 = grab.month_map_data("/media/windowsshare",modelname,monthnum,var1)
-        lons,lats,vars2,varnames2 = grab.month_map_data("/media/windowsshare",modelname,monthnum,var2)
+        lons,lats,vars1,varnames1 = grab.month_map_data(grab.DATA_ROOT,modelname,monthnum,var1)
+        lons,lats,vars2,varnames2 = grab.month_map_data(grab.DATA_ROOT,modelname,monthnum,var2)
         for i in xrange(20):
             var1_slab = vars1[i,:,:]
             var2_slab = vars2[i,:,:]
             total_slab = var1_slab + var2_slab
             #now we will make the plot
             fig, ax = plt.subplots(figsize=(8, 8))
-            m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
+            m = antarctic_map()
             m.drawmapboundary(linewidth=0.3)
             cm = m.pcolormesh(lons, lats, total_slab, latlon=True, cmap='gist_rainbow')
             cbar = m.colorbar(cm, location='bottom', pad="5%")
@@ -523,7 +684,7 @@ def regrid(arr1,lats1,lons1,arr2,lats2,lons2,modelname,monthstr):
     # in the area that we are plotting over. 
     #NEW VERSION
     fig,ax=plt.subplots(figsize=(8,8))
-    m = Basemap(resolution='h', projection='spstere',lat_0=-90, lon_0=-180, boundinglat=-55)
+    m = antarctic_map()
     m.drawmapboundary(fill_color='grey')
     arr1_regrid,arr2_regrid,grid_anom,glons,glats = process.regrid(arr1,lats1,lons1,arr2,lats2,lons2,modelname,monthstr)
     cs=m.pcolormesh(glons,glats,grid_anom,latlon=True,cmap='seismic')
@@ -541,8 +702,8 @@ def hist(modelname,monthnum,variable):
     cords = []
     vals = []
     test = variable[0]
-    for x in range(0,125):
-        for y in range(0,360):
+    for x in range(test.shape[0]):
+        for y in range(test.shape[1]):
             try:
                 if test[x,y]>0.2: #just taking the points for where theres a decent amount of ice as this is where we want to compare 
                     cords.append([x,y])
@@ -0,0 +1,57 @@
+"""reads files ahead on worker processes while the current one is being used, so that waiting on the network share overlaps with computation.
+processes are used rather than threads because netCDF4 (and HDF5 underneath it) is not thread safe, and holds the GIL while it reads."""
+import collections
+import multiprocessing
+
+def prefetch(func, tasks, depth=4):
+    """returns an iterator over func(task) for each task in tasks, in order. the first depth calls start straight away on a pool of depth
+    worker processes, and another starts each time a result is taken, so no more than depth results are ever waiting in memory. func has to be a module level function so that it can be sent to the workers. with depth 0,
+    a single task, or inside a worker process (which is not allowed to start processes of its own), everything is run in this process instead.
+    the iterator's close() stops any calls still running, even if no result has been taken yet (it can also be used as a context manager)"""
+    tasks = list(tasks)
+    if depth < 1 or len(tasks) < 2 or multiprocessing.current_process().daemon:
+        return _Results(None, (func(task) for task in tasks))
+    pool = multiprocessing.Pool(depth)
+    pending = collections.deque(pool.apply_async(func, (task,)) for task in tasks[:depth])
+    return _Results(pool, _results(pool, pending, func, tasks[depth:]))
+
+class _Results(object):
+    """iterator over the results of prefetch, which owns the pool (None if everything is run in this process) until it is closed"""
+
+    def __init__(self, pool, results):
+        self.pool = pool
+        self.results = results
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self.results)
+
+    def close(self):
+        # a generator which was never started does not run its finally block when closed, so the pool is stopped here as well
+        self.results.close()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _results(pool, pending, func, tasks):
+    """yields the results of the pending calls in order, starting the call for the next task each time a result is taken"""
+    try:
+        for task in tasks:
+            result = pending.popleft().get()
+            pending.append(pool.apply_async(func, (task,)))
+            yield result
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # also stops any reads still running if the caller gives up early
+        pool.terminate()
+        pool.join()
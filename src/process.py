@@ -2,29 +2,59 @@
 
 #import libraries
 import grab
+import regridder
+import dataset
 import numpy as np
 import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
 import scipy
 from scipy import stats
+from scipy import special
 import os
 import sys
 import csv
-from scipy.interpolate import griddata
+import multiprocessing
+from multiprocessing import sharedctypes
+
+def t_test_stack(stack1, stack2, equal_var=True):
+    """performs the t-test on every gridpoint of two time*lat*lon stacks at once, reducing along the time axis instead of looping over gridpoints.
+    masked entries are left out, so each gridpoint uses its own sample sizes. if equal_var is true this is the student's t-test (same as
+    scipy.stats.mstats.ttest_ind), otherwise it is welch's t-test. either stack can be a dataset.LazyVariable, which is streamed through
+    instead of being read in. returns masked arrays of the t-statistics and the two-tailed p values"""
+    n1, x1, v1 = _moments(stack1)
+    n2, x2, v2 = _moments(stack2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if equal_var:
+            df = np.ma.asarray(n1 + n2 - 2.0)
+            svar = ((n1-1)*v1 + (n2-1)*v2) / df
+            denom = np.ma.sqrt(svar*(1.0/n1 + 1.0/n2))
+        else:
+            vn1 = v1/n1
+            vn2 = v2/n2
+            df = (vn1 + vn2)**2 / (vn1**2/(n1 - 1) + vn2**2/(n2 - 1))
+            df = np.ma.masked_invalid(df).filled(1)
+            denom = np.ma.sqrt(vn1 + vn2)
+        tstats = np.ma.masked_invalid((x1 - x2) / denom)
+        pvals = special.betainc(0.5*np.ma.getdata(df), 0.5,
+                                 np.ma.getdata(df/(df + tstats*tstats)))
+    # gridpoints without enough data to do the test are masked
+    mask = np.ma.getmaskarray(tstats) | np.isnan(pvals)
+    pvals[mask] = 1.0
+    return np.ma.masked_array(tstats, mask), np.ma.masked_array(pvals, mask)
+
+def _moments(stack):
+    """returns the number of values, mean and variance (with 1 delta degree of freedom) along the time axis of a stack or a dataset.LazyVariable"""
+    if isinstance(stack, dataset.LazyVariable):
+        stats = stack.stats()
+        return stats.count, stats.mean(), stats.variance(1)
+    stack = np.ma.asarray(stack)
+    # accumulating in float64 even if the stack is float32
+    return stack.count(axis=0), stack.mean(axis=0, dtype='float64'), stack.var(axis=0, ddof=1, dtype='float64')
 
 def t_test_gridpoint(lons,lats,modelvar,controlvar,pval_filter, t_or_p):
     """with data given, performs the student's t-test on each gridpoint of an area for the new model (modelval) and the control model(controlvar) and returns either the t-statistic where the corresponding pvalue is below pval filter or p value at each point depending on t_or_p (if true, returns tstat, if false returns pvalues)"""
     #first checking that modelvar and control var are the same shape
     assert controlvar.shape == modelvar.shape
-    [z,x,y] = modelvar.shape
-    
-    # now making an empty array to chuck results into
-    tstats = np.ma.zeros([x, y])
-    pvals = np.ma.zeros([x, y])
-    for i in xrange(x):
-        for j in xrange(y):
-            tstats[i, j], pvals[i, j] = scipy.stats.mstats.ttest_ind(
-                controlvar[:, i, j], modelvar[:, i, j])
+    tstats, pvals = t_test_stack(controlvar, modelvar)
 
     tstats = np.ma.masked_where(pvals > pval_filter, tstats)
     if t_or_p:
@@ -34,26 +64,27 @@ def t_test_gridpoint(lons,lats,modelvar,controlvar,pval_filter, t_or_p):
 
 def read_lims(varname,csvdir):
     """reads upper and lower limits for plot from the dir csvdir in the file varname.txt and returns them"""
-    #first changing into correct directory
-    os.chdir(csvdir)
-    print os.listdir("./")    
-    
-    with open("{}.txt".format(varname)) as File:
+    with open(os.path.join(csvdir, "{}.txt".format(varname))) as File:
         reader = csv.DictReader(File)
         for row in reader:
             return row #there should only be one row
 
-def anom_limit_setup(varname,months,models,csvdir):
-    """sets upper and lower bound for a variable for anomaly plots based on the max/min value TOTAL across all anomalies"""
-    for model in models:
-            maxes = []
-            mins = []
-            for month in months:
-                lons,lats,myvar,totaldiff,units = grab.month_map_anom("/media/windowsshare",model,month,varname,False)
-                maxes.append(np.ma.max(myvar))
-                mins.append(np.ma.min(myvar))
-    os.chdir(csvdir)
-    with open("{}.txt".format(varname),"w+") as csv_file:
+def anom_limit_setup(varname,months,models,csvdir,path=grab.DATA_ROOT,control=grab.CONTROL):
+    """sets upper and lower bound for a variable for anomaly plots based on the max/min value TOTAL across all anomalies (against control).
+    path can also be a dataset.ModelRun, in which case the anomalies are only over the years and rows of the run"""
+    maxes = []
+    mins = []
+    if isinstance(path, dataset.ModelRun):
+        lons,lats,anoms,total_diffs,units = dataset.month_map_anom_multi(path,models,months,[varname],False,control)
+    else:
+        lons,lats,anoms,total_diffs,units = grab.month_map_anom_multi(path,models,months,[varname],False,control=control)
+    for myvar in anoms.values():
+        maxes.append(np.ma.max(myvar))
+        mins.append(np.ma.min(myvar))
+    limsfile = os.path.join(csvdir, "{}.txt".format(varname))
+    # written under a temporary name first so that read_lims never sees a half written file
+    tempfile = "{}.{}".format(limsfile, os.getpid())
+    with open(tempfile,"w+") as csv_file:
         fieldnames=['Max','Min']
         writer = csv.DictWriter(csv_file,fieldnames=fieldnames) 
         writer.writeheader()
@@ -66,74 +97,156 @@ def anom_limit_setup(varname,months,models,csvdir):
         else:
             data = {'Max':absmin, 'Min':-1.0*absmin}
         writer.writerow(data)
+    os.rename(tempfile, limsfile)
     print "finished writing limits. They are {} and {}".format(max(maxes),min(mins))
 
 def total_ice_diff(path,modelname,monthnum):
     """function to calculate the total difference in ice volume between a model and a control for a give month"""  
-    lons, lats, aice_diff, total_aice_diff, units = grab.month_map_anom(path,modelname,monthnum,"aice",True)
-    lons, lats, sithick_diff, total_sithick_diff, units = grab.month_map_anom(path,modelname,monthnum,"sithick",True)
+    lons, lats, aice_diff, total_aice_diff, units = grab.month_map_anom_test(path,modelname,monthnum,"aice",True)
+    lons, lats, sithick_diff, total_sithick_diff, units = grab.month_map_anom_test(path,modelname,monthnum,"sithick",True)
     print "total aice change is {}".format(np.sum(aice_diff))
     print "shape of aice_diff is {}".format(np.shape(aice_diff))
     print "shape of sithick diff is {}".format(np.shape(sithick_diff))
     print "total ice volume difference is {}".format(np.sum(np.multiply(aice_diff,sithick_diff)))
 
+def target_grid(nx, ny, boundinglat=-55):
+    """returns the lons and lats of a regular nx*ny grid on the south polar stereographic map used for all of the plots
+    (Basemap spstere with lon_0=-180). this is worked out directly so no Basemap needs to be built"""
+    return regridder.spstere_grid(nx, ny, boundinglat=boundinglat, lon_0=-180.0)
+
+def regrid_stack(stack, lats, lons, glons, glats):
+    """regrids a t*y*x stack of arrays (or a single y*x array) with latitudes lats and longitudes lons onto the target grid glons, glats.
+    points which are masked in every array of the stack (i.e land) are left out of the interpolation. returns the regridded stack, which is NaN
+    wherever it could not be interpolated, and the mask of missing data on the target grid (where the gridcells are mostly land).
+    the stack can be a dataset.LazyVariable, which is regridded a chunk at a time"""
+    if isinstance(stack, dataset.LazyVariable):
+        landmask = stack.stats().count == 0
+        weights = regridder.Regridder(lons, lats, glons, glats, landmask)
+        gstack = np.concatenate([weights.regrid(chunk) for indices, chunk in stack.chunks()])
+    else:
+        stack = np.ma.asarray(stack)
+        landmask = np.ma.getmaskarray(stack)
+        if landmask.ndim == 3:
+            landmask = landmask.all(axis=0)
+        gstack = regridder.Regridder(lons, lats, glons, glats, landmask).regrid(stack)
+    # make mask of missing data (ie land)
+    gmask = regridder.Regridder(lons, lats, glons, glats).regrid(landmask)
+    with np.errstate(invalid='ignore'):
+        gmask = gmask > 0.5
+    return gstack, gmask
+
 def regrid(arr1,lats1,lons1,arr2,lats2,lons2,modelname,monthstr):
     """takes two netCDF arrays and their respective latitudes and longitudes and regrids 
     both arrays to be on the same grid."""
     #NOTE!!!!!!!! Here arr1 should be the model data and arr2 should be the NSIDC data (this is because the model has coarser resolution
     # in the area that we are plotting over. 
-    m = Basemap(resolution='h', projection='spstere',
-                lat_0=-90, lon_0=-180, boundinglat=-55)
-    m.drawmapboundary(fill_color='grey')
-    
-    #projecting both arrays onto grid
     #make mesh grid of latlons for plotting
     ny=arr1.shape[0]; nx=arr1.shape[1]
     print("shape of model data is {},{}".format(nx,ny))
-    glons,glats = m.makegrid(nx,ny)
+    glons,glats = target_grid(nx,ny)
 
     #interp data of real world to this reg grid 
-    gdata1 = griddata((lons1[~arr1.mask].ravel(),lats1[~arr1.mask].ravel()),
-                    arr1[~arr1.mask].ravel(),(glons,glats),method='cubic')
-    
-    gdata2 = griddata((lons2[~arr2.mask].ravel(),lats2[~arr2.mask].ravel()),arr2[~arr2.mask].ravel(),(glons,glats),method='cubic')
-   
-    # make mask of missing data (ie land)
-    mask = np.zeros((ny,nx))
-    mask[arr1.mask] = 1
-    gmask = griddata((lons1.ravel(),lats1.ravel()),mask.ravel(),
-                    (glons,glats),method='cubic')
-    pdat = np.ma.masked_array(gdata1-gdata2,gmask>0.5) # masked, gridded array
+    gdata1, gmask = regrid_stack(arr1,lats1,lons1,glons,glats)
+    gdata2, gmask2 = regrid_stack(arr2,lats2,lons2,glons,glats)
+    pdat = np.ma.masked_array(gdata1-gdata2,gmask) # masked, gridded array
     return gdata1,gdata2,pdat,glons,glats
 
+def permutation_indices(m, n, num_rounds, seed):
+    """returns the num_rounds permutations of range(m+n) that mlxtend's permutation_test (method='approximate') visits for a given seed.
+    mlxtend shuffles the same combined array every round, so these only depend on the sample sizes and not on the data"""
+    rng = np.random.RandomState(seed)
+    indices = np.arange(m + n)
+    perms = np.empty([num_rounds, m + n], dtype=int)
+    for i in xrange(num_rounds):
+        rng.shuffle(indices)
+        perms[i] = indices
+    return perms
+
+def permutation_test_stack(arraystack_1, arraystack_2, num_rounds=1000, seed=0, chunksize=4096):
+    """performs the approximate permutation test of the difference of the means on every gridpoint of two t*n*m array stacks
+    (the t axes can be different lengths). one set of permutations is drawn from seed and applied to all gridpoints at once, which gives the
+    same p values as calling mlxtend's permutation_test on the history of each gridpoint with the same seed (see permutation_check.py). masked entries become NaN
+    (so that gridpoint gets a p value of 0), as they did when gridpoints were passed to mlxtend one at a time. chunksize gridpoints are
+    done at once to bound memory use. returns an n*m array of p values"""
+    arraystack_1 = np.ma.filled(np.ma.asarray(arraystack_1, dtype='float64'), np.nan)
+    arraystack_2 = np.ma.filled(np.ma.asarray(arraystack_2, dtype='float64'), np.nan)
+    [t1, x, y] = arraystack_1.shape
+    t2 = arraystack_2.shape[0]
+    # one row per gridpoint holding its history from both stacks
+    histories = np.concatenate([arraystack_1.reshape(t1, x*y),
+                                arraystack_2.reshape(t2, x*y)]).T.copy()
+    perms = permutation_indices(t1, t2, num_rounds, seed)
+    pvals = np.zeros(x*y)
+    for start in xrange(0, x*y, chunksize):
+        chunk = histories[start:start + chunksize]
+        reference = _mean_difference(chunk, t1)
+        more_extreme = np.zeros(len(chunk))
+        with np.errstate(invalid='ignore'):
+            for perm in perms:
+                more_extreme += _mean_difference(chunk[:, perm], t1) > reference
+        pvals[start:start + chunksize] = more_extreme / num_rounds
+    return pvals.reshape(x, y)
+
+def _mean_difference(histories, t1):
+    """returns the absolute difference between the means of the first t1 and the rest of the values in each row of histories. each part is
+    copied into its own contiguous array first, as the mean of a strided view is summed in a different order to np.mean of a single
+    gridpoint's history, which rounds differently and so breaks ties with the reference differently to mlxtend"""
+    return np.abs(np.ascontiguousarray(histories[:, :t1]).mean(axis=1) - np.ascontiguousarray(histories[:, t1:]).mean(axis=1))
+
+# arrays shared with the worker processes of permutation_test_parallel, keyed by name
+_shared = {}
+
+def _share(array):
+    """copies a float array into shared memory so that worker processes can read it without it being pickled. returns (buffer, shape)"""
+    buf = sharedctypes.RawArray('d', array.size)
+    np.frombuffer(buf).reshape(array.shape)[...] = array
+    return buf, array.shape
+
+def _init_worker(shared):
+    _shared.update(shared)
+
+def _permutation_tile(args):
+    """runs permutation_test_stack on one tile of the stacks held in shared memory"""
+    rows, cols, num_rounds, seed, chunksize = args
+    stacks = []
+    for name in ["stack1", "stack2"]:
+        buf, shape = _shared[name]
+        stacks.append(np.frombuffer(buf).reshape(shape)[:, rows, cols])
+    return rows, cols, permutation_test_stack(stacks[0], stacks[1], num_rounds, seed, chunksize)
+
+def permutation_test_parallel(arraystack_1, arraystack_2, num_rounds=1000, seed=0, workers=None, tilesize=25, chunksize=4096):
+    """same as permutation_test_stack, but the n*m grid is split into tilesize*tilesize tiles which are farmed out to a pool of worker processes
+    (one per core if workers is None). the stacks are handed to the workers through shared memory. every tile uses the same permutations, so the
+    p values only depend on seed and not on the number of workers"""
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers == 1:
+        return permutation_test_stack(arraystack_1, arraystack_2, num_rounds, seed, chunksize)
+    arraystack_1 = np.ma.filled(np.ma.asarray(arraystack_1, dtype='float64'), np.nan)
+    arraystack_2 = np.ma.filled(np.ma.asarray(arraystack_2, dtype='float64'), np.nan)
+    [t, x, y] = arraystack_1.shape
+    tiles = []
+    for i in xrange(0, x, tilesize):
+        for j in xrange(0, y, tilesize):
+            tiles.append((slice(i, i + tilesize), slice(j, j + tilesize), num_rounds, seed, chunksize))
+    shared = {"stack1": _share(arraystack_1), "stack2": _share(arraystack_2)}
+    pvals = np.zeros([x, y])
+    pool = multiprocessing.Pool(workers, _init_worker, (shared,))
+    try:
+        for count, (rows, cols, tile) in enumerate(pool.imap_unordered(_permutation_tile, tiles)):
+            pvals[rows, cols] = tile
+            print "finished permutation test tile {}/{}".format(count + 1, len(tiles))
+    finally:
+        pool.close()
+        pool.join()
+    return pvals
+
 def permutation_test(arraystack_1, arraystack_2):
     #takes two n*m*t arrays, where the n*m represents a grid of variables and the t represents that area of gridcells as it changes in time. 
-    [x,y] = np.shape(arraystack_1[0])
-    pvals = np.zeros([x,y])
-    count = 0
-    total = x*y
-    for i in range(0,x):
-        for j in range(0,y):
-            t = time.time()
-            NSIDC_sample = [] 
-            model_sample = []
-            for arr in arraystack_1:
-                model_sample.append(arr[i,j])
-            for arr in arraystack_2:
-                NSIDC_sample.append(arr[i,j])
-            NSIDC_sample = np.asarray(NSIDC_sample)
-            model_sample = np.asarray(model_sample)
-            print "doing permutation test {}/{}".format(count,total)
-            pvals[i,j] = permutation_test(NSIDC_sample,model_sample,
-                                            method='approximate',
-                                            num_rounds=1000,
-                                            seed=0)
-            elapsed = time.time() - t
-            print pvals[i,j]
-            print "time required to do one operation is {}".format(elapsed)
-            count += 1
+    pvals = permutation_test_parallel(arraystack_1, arraystack_2, num_rounds=1000, seed=0)
     np.save('/home/ben/Desktop/pvals.npy',pvals)
     print "permutation_test done"
+    return pvals
 
 if __name__=="__main__":
-    total_ice_diff("/media/windowsshare/","u-au866",2) 
+    total_ice_diff(grab.DATA_ROOT,"u-au866",2) 
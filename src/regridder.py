@@ -0,0 +1,96 @@
+"""tools for regridding fields from one grid onto another using interpolation weights which are only calculated once."""
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+from scipy.spatial import Delaunay
+import cache
+
+# weights are stored on the local disk next to the cube cache
+WEIGHTS_DIR = os.path.join(cache.CACHE_DIR, "regrid")
+
+def grid_key(*arrays):
+    """returns a hash identifying a set of grids (and masks) from the values of their arrays"""
+    sha = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(str(array.shape))
+        sha.update(str(array.dtype))
+        sha.update(array.data)
+    return sha.hexdigest()
+
+def spstere_grid(nx, ny, boundinglat=-55.0, lon_0=-180.0):
+    """returns the lons and lats of an nx*ny grid evenly spaced on the south polar stereographic map, the same as
+    Basemap(projection='spstere', boundinglat=boundinglat, lon_0=lon_0).makegrid(nx, ny) but without building a Basemap.
+    the map is the square which just contains the circle of latitude boundinglat, with lon_0 at the top"""
+    # distance of boundinglat from the pole (in units of the earth's diameter, which cancels out)
+    rho = np.tan(np.pi/4.0 + np.radians(boundinglat)/2.0)
+    # as with Basemap, x and y run from the lower left corner (at lon_0+45) to the upper right corner
+    x = rho - 2.0*rho*np.indices((ny, nx))[1]/(nx - 1)
+    y = rho - 2.0*rho*np.indices((ny, nx))[0]/(ny - 1)
+    lons = lon_0 + np.degrees(np.arctan2(x, y))
+    lons = (lons + 180.0) % 360.0 - 180.0
+    lats = np.degrees(2.0*np.arctan(np.hypot(x, y))) - 90.0
+    return lons, lats
+
+class Regridder(object):
+    """linearly interpolates fields given at the points (lons, lats) of a source grid onto the points (glons, glats) of a target grid.
+    the source points (leaving out those where mask is true) are triangulated once, and each target point gets the indices of the three
+    vertices of the triangle it falls in along with its barycentric weights. these are stored as a sparse matrix, which is cached on disk
+    keyed by the grids, so regridding a whole time stack is a single sparse matrix multiply."""
+
+    def __init__(self, lons, lats, glons, glats, mask=None, weightsdir=WEIGHTS_DIR):
+        lons = np.ma.getdata(lons).astype('float64')
+        lats = np.ma.getdata(lats).astype('float64')
+        glons = np.ma.getdata(glons).astype('float64')
+        glats = np.ma.getdata(glats).astype('float64')
+        if mask is None:
+            mask = np.zeros(lons.shape, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+        self.shape = glons.shape
+        self.source_shape = lons.shape
+        weightsfile = os.path.join(
+            weightsdir, grid_key(lons, lats, mask, glons, glats) + ".npz")
+        if os.path.exists(weightsfile):
+            stored = np.load(weightsfile)
+            self.weights = sparse.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]), shape=tuple(stored["shape"]))
+            self.inside = stored["inside"]
+        else:
+            self.weights, self.inside = self._weights(lons, lats, glons, glats, mask)
+            if not os.path.isdir(weightsdir):
+                os.makedirs(weightsdir)
+            np.savez(weightsfile, data=self.weights.data, indices=self.weights.indices,
+                     indptr=self.weights.indptr, shape=self.weights.shape, inside=self.inside)
+
+    def _weights(self, lons, lats, glons, glats, mask):
+        """triangulates the unmasked source points and returns the sparse weight matrix (target points * source points)
+        along with a boolean array of which target points are inside the triangulation"""
+        valid = np.flatnonzero(~mask.ravel())
+        points = np.column_stack([lons.ravel()[valid], lats.ravel()[valid]])
+        targets = np.column_stack([glons.ravel(), glats.ravel()])
+        triangulation = Delaunay(points)
+        simplex = triangulation.find_simplex(targets)
+        inside = simplex >= 0
+        simplex = simplex[inside]
+        # barycentric coordinates of each target point in the triangle it falls in
+        transform = triangulation.transform[simplex]
+        bary = np.einsum('ijk,ik->ij', transform[:, :2, :], targets[inside] - transform[:, 2, :])
+        bary = np.column_stack([bary, 1.0 - bary.sum(axis=1)])
+        vertices = valid[triangulation.simplices[simplex]]
+        rows = np.repeat(np.flatnonzero(inside), 3)
+        weights = sparse.csr_matrix((bary.ravel(), (rows, vertices.ravel())),
+                                    shape=(targets.shape[0], lons.size))
+        return weights, inside
+
+    def regrid(self, fields):
+        """regrids a single field (y*x) or a stack of fields (t*y*x) on the source grid. masked values are treated as missing, and target
+        points which depend on a missing value or are outside of the source grid are NaN."""
+        fields = np.ma.filled(np.ma.asarray(fields, dtype='float64'), np.nan)
+        single = fields.ndim == 2
+        fields = fields.reshape(-1, fields.shape[-2]*fields.shape[-1])
+        result = self.weights.dot(fields.T).T
+        result[:, ~self.inside] = np.nan
+        if single:
+            return result.reshape(self.shape)
+        return result.reshape((fields.shape[0],) + self.shape)
@@ -0,0 +1,179 @@
+"""rewrites the monthly files of a model run into a single chunked NetCDF4 (HDF5) store on the local disk, for reading time series. each variable
+is chunked in CHUNK = (time, y, x) blocks, so the whole history of a gridcell is a handful of chunks instead of a read from every monthly file,
+and a month's stack only needs the chunks of its rows. grab reads from the store instead of the files whenever it is up to date with them.
+can be run as
+    python store.py icedir [varname ...]"""
+import os
+import sys
+import hashlib
+import numpy as np
+from netCDF4 import Dataset
+import cache
+import catalogue
+import prefetch
+
+# stores live on the local disk next to the cube cache
+STORE_DIR = os.path.join(cache.CACHE_DIR, "stores")
+# shape of the chunks of each variable, (time, y, x): ten years of monthly fields by 32*32 gridcells
+CHUNK = (120, 32, 32)
+# compression of every variable, as keyword arguments of netCDF4's createVariable. convert() can be given different ones for some variables
+COMPRESSION = {"zlib": True, "complevel": 4, "shuffle": True}
+# most memory a block of fields being converted can take up, the variables are written a few at a time to stay under it
+MAX_BLOCK_BYTES = 512*1024**2
+# number of files read ahead while converting
+PREFETCH = 4
+
+# (store mtime, {(filename, size, mtime): time index}, variable names) of the stores which have been opened, by path
+_indexes = {}
+
+def store_path(icedir):
+    """returns where the store of the model files in icedir goes"""
+    return os.path.join(STORE_DIR, hashlib.sha1(os.path.abspath(icedir)).hexdigest() + ".nc")
+
+def convert(icedir, varnames=None, compression=None, storefile=None):
+    """rewrites the files in icedir into a store at storefile (store_path(icedir) by default) and returns its path. varnames are the variables
+    to keep, every (time, y, x) variable by default. compression maps variable names to the createVariable keyword arguments to use for them
+    instead of COMPRESSION, e.g. {'aice': {'zlib': True, 'complevel': 9, 'least_significant_digit': 3}}. the fields keep the precision of the
+    files. the time axis holds the files in date order, along with the name, size and mtime of each so readers can tell what is up to date."""
+    icedir = os.path.abspath(icedir)
+    records = catalogue.catalogue(icedir).files()
+    if not records:
+        raise IOError("no monthly files in {}".format(icedir))
+    if storefile is None:
+        storefile = store_path(icedir)
+    if compression is None:
+        compression = {}
+    first = Dataset(records[0][2])
+    if varnames is None:
+        varnames = [varname for varname, variable in first.variables.items() if variable.ndim == 3]
+    ny, nx = first.variables[varnames[0]].shape[-2:]
+    nt = len(records)
+
+    storedir = os.path.dirname(storefile)
+    if not os.path.isdir(storedir):
+        os.makedirs(storedir)
+    # written under a temporary name first so that no reader can open a half written store
+    tempfile = "{}.{}".format(storefile, os.getpid())
+    store = Dataset(tempfile, "w", format="NETCDF4")
+    try:
+        store.createDimension("time", nt)
+        store.createDimension("y", ny)
+        store.createDimension("x", nx)
+        store.icedir = icedir
+        for name, dtype, column in (("year", "i4", 0), ("month", "i4", 1), ("size", "i8", 3), ("mtime", "i8", 4)):
+            store.createVariable(name, dtype, ("time",))[:] = np.array([record[column] for record in records])
+        filenames = store.createVariable("filename", str, ("time",))
+        for filenum, record in enumerate(records):
+            filenames[filenum] = os.path.basename(record[2])
+        chunks = (min(CHUNK[0], nt), min(CHUNK[1], ny), min(CHUNK[2], nx))
+        for varname in varnames:
+            variable = first.variables[varname]
+            options = dict(COMPRESSION)
+            options.update(compression.get(varname, {}))
+            stored = store.createVariable(varname, variable.dtype, ("time", "y", "x"), chunksizes=chunks,
+                                          fill_value=getattr(variable, "_FillValue", None), **options)
+            stored.setncatts(dict((attr, variable.getncattr(attr)) for attr in variable.ncattrs() if attr != "_FillValue"))
+
+        # a block of files at a time, the length of a chunk so that whole chunks are written at once
+        itemsize = max(first.variables[varname].dtype.itemsize for varname in varnames)
+        pergroup = max(1, MAX_BLOCK_BYTES // (chunks[0]*ny*nx*itemsize))
+        groups = [varnames[start:start + pergroup] for start in xrange(0, len(varnames), pergroup)]
+        for start in xrange(0, nt, chunks[0]):
+            block = records[start:start + chunks[0]]
+            for group in groups:
+                print "converting {} of files {} to {} of {}".format(", ".join(group), start + 1, start + len(block), nt)
+                fields = prefetch.prefetch(_read_block, [(record[2], group) for record in block], PREFETCH)
+                stacks = dict((varname, []) for varname in group)
+                for myvars in fields:
+                    for varname in group:
+                        stacks[varname].append(myvars[varname])
+                for varname in group:
+                    store.variables[varname][start:start + len(block)] = np.ma.stack(stacks[varname])
+    finally:
+        store.close()
+        first.close()
+    os.rename(tempfile, storefile)
+    return storefile
+
+def _read_block(task):
+    """returns {varname: field} for the varnames of a file, in the precision of the file. task is (filepath, varnames)"""
+    filepath, varnames = task
+    testdata = Dataset(filepath)
+    myvars = dict((varname, testdata.variables[varname][0]) for varname in varnames)
+    testdata.close()
+    return myvars
+
+def _index(icedir):
+    """returns (storefile, {(filename, size, mtime): time index}, variable names) of the store of icedir, or None if it has none"""
+    storefile = store_path(icedir)
+    if not os.path.exists(storefile):
+        return None
+    mtime = os.stat(storefile).st_mtime
+    if storefile not in _indexes or _indexes[storefile][0] != mtime:
+        store = Dataset(storefile)
+        files = zip(store.variables["filename"][:], store.variables["size"][:], store.variables["mtime"][:])
+        index = dict(((str(filename), int(size), int(filemtime)), filenum) for filenum, (filename, size, filemtime) in enumerate(files))
+        _indexes[storefile] = (mtime, index, set(store.variables))
+        store.close()
+    return (storefile,) + _indexes[storefile][1:]
+
+def read(filepaths, varnames, rows, isice, dtype, cols=slice(None)):
+    """returns an iterator over (units, fields) for each of filepaths, the same as grab's loaders get from the files themselves, but read from the
+    store of their directory a chunk at a time. returns None if there is no store, or it does not have all of varnames or is not up to date with
+    every one of the files, so that the files are read instead. rows and cols are the slices of the grid to read, isice and dtype are as in grab"""
+    if not filepaths:
+        return None
+    icedir = os.path.dirname(os.path.abspath(filepaths[0]))
+    found = _index(icedir)
+    if found is None:
+        return None
+    storefile, index, names = found
+    needed = set(varnames) | (set() if isice else set(["aice"]))
+    if not needed <= names:
+        return None
+    files = dict((record[2], (os.path.basename(record[2]), record[3], record[4])) for record in catalogue.catalogue(icedir).records)
+    try:
+        times = np.array([index[files[os.path.abspath(filepath)]] for filepath in filepaths])
+    except KeyError:
+        # a file the store has not seen, or which has changed since
+        return None
+
+    print "grabbing {} of {} files from {}".format(", ".join(varnames), len(filepaths), storefile)
+    return _fields(storefile, times, varnames, needed, rows, cols, isice, dtype)
+
+def _fields(storefile, times, varnames, needed, rows, cols, isice, dtype):
+    """yields (units, fields) for each of the time indices times of a store in order. the files are read a chunk along the time axis at a time, so
+    no more than that is held at once and, as times are normally in order, each chunk is only decompressed once"""
+    store = Dataset(storefile)
+    try:
+        units = dict((varname, getattr(store.variables[varname], "units", None)) for varname in varnames)
+        chunking = store.variables[varnames[0]].chunking()
+        length = len(store.dimensions["time"]) if chunking == "contiguous" else chunking[0]
+        filenum = 0
+        while filenum < len(times):
+            # the run of files after this one which are in the same chunk
+            chunk = times[filenum] // length
+            end = filenum + 1
+            while end < len(times) and times[end] // length == chunk:
+                end += 1
+            first, last = times[filenum:end].min(), times[filenum:end].max()
+            blocks = {}
+            for varname in needed:
+                block = store.variables[varname][first:last + 1, rows, cols]
+                if dtype != "native":
+                    block = np.ma.array(block, dtype=dtype)
+                blocks[varname] = block
+            for time in times[filenum:end] - first:
+                myvars = {}
+                for varname in varnames:
+                    myvars[varname] = np.ma.squeeze(blocks[varname][time])
+                    if isice == False:
+                        #set all sections where there is no ice to NaN as there should be no data here...
+                        myvars[varname] = np.ma.masked_where(np.ma.squeeze(blocks["aice"][time]) == 0, myvars[varname])
+                yield dict(units), myvars
+            filenum = end
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    convert(sys.argv[1], sys.argv[2:] or None)
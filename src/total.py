@@ -1,10 +1,12 @@
+import plot
+
 myvars = ['sithick','sispeed','sihc','siflswdbot','siflsendupbot','siflcondtop','siflcondbot','fsurf_ai','fhocn_ai','ardg','dardg1dt','opening','snoice']
 control = 'u-at053'
 models = ['u-au866','u-au872','u-au874','u-av231']
 months=[2,9]
-for var in myvars:
-    for month in months:
-        month_map_mean_main(control,month,var,"/home/ben/Documents/summer2019/plotlims",False)
-        for model in models:
-            month_map_mean_main(model,month,var,"/home/ben/Documents/summer2019/plotlims",False)
-            month_map_anom_main(model,month,var,"/home/ben/Documents/summer2019/plotlims",False)
+csvdir = "/home/ben/Documents/summer2019/plotlims"
+outdir = "/home/ben/Desktop/mapplots"
+#every figure is a job, figures whose input files have not changed since they were last drawn are skipped
+jobs = [("mean",model,month,var) for model in [control]+models for var in myvars for month in months]
+jobs += [("anom",model,month,var) for var in myvars for month in months for model in models]
+plot.render_batch(jobs,outdir,csvdir,isice=False)